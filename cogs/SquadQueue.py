@@ -5,8 +5,19 @@ from dateutil.parser import parse
 from datetime import datetime, timezone, timedelta
 import time
 import json
-from mmr import mk8dx_150cc_mmr, get_mmr_from_discord_id, mk8dx_150cc_fc, lounge_data
+import math
+from functools import partial
+from mmr import LoungeClient, lounge_data
 from mogi_objects import Mogi, Team, Player, Room, VoteView, JoinView, get_tier
+from outbound import MessageScheduler, PRIORITY_ROOM, PRIORITY_HISTORY
+from provisioner import ThreadProvisioner
+from matchmaking import make_rooms
+from journal import Journal, parse_time, mogi_key
+from deadlines import DeadlineScheduler
+from queues import load_queues
+from metrics import MetricsServer
+import metrics
+from recorder import Recorder, RECORDED_COMMANDS
 import asyncio
 
 # Scheduled_Event = collections.namedtuple('Scheduled_Event', 'size time started mogi_channel')
@@ -16,85 +27,227 @@ class SquadQueue(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
-        # keys are discord.Guild objects, values are list of Mogi instances
-        self.scheduled_events = {}
-        # keys are discord.TextChannel objects, values are instances of Mogi
-        self.ongoing_events = {}
+        # name -> Queue; each queue has its own settings, channels, mogis and list
+        self.queues = load_queues(bot.config)
+        # join channel id -> Queue, which is how commands and mogis find their queue
+        self.queues_by_channel = {queue.join_channel_id: queue for queue in self.queues.values()}
 
-        self.old_events = {}
-
-        self.sq_times = []
+        # room thread id -> (Mogi, Room) for every room of ongoing and old events,
+        # so thread lookups don't have to scan every mogi
+        self.room_threads = {}
 
         self._lounge_fetch = self.lounge_mmr.start()
-        self._que_scheduler = self.que_scheduler.start()
-        self._scheduler_task = self.sqscheduler.start()
-        self._msgqueue_task = self.send_queued_messages.start()
-        self._list_task = self.list_task.start()
-        self._end_mogis_task = self.delete_old_mogis.start()
-
-        self.msg_queue = {}
-
-        self.list_messages = []
-
-        self.QUEUE_TIME_BLOCKER = datetime.now(timezone.utc)
-
-        self.GUILD = None
-
-        self.MOGI_CHANNEL = None
-
-        self.SUB_CHANNEL = None
-
-        self.LIST_CHANNEL = None
-
-        self.HISTORY_CHANNEL = None
-
-        self.LOCK = asyncio.Lock()
-
-        self.URL = bot.config["url"]
 
-        self.MOGI_LIFETIME = bot.config["MOGI_LIFETIME"]
+        # the queue lifecycle runs off exact deadlines (queue open, joining end,
+        # extension end, vote end, mogi expiry, list refresh) instead of polling
+        self.deadlines = DeadlineScheduler()
 
-        self.SUB_MESSAGE_LIFETIME_SECONDS = bot.config["SUB_MESSAGE_LIFETIME_SECONDS"]
+        # every channel message goes out through here, rate limited per channel
+        self.outbound = MessageScheduler()
 
-        self.SIX_VS_SIX_THRESHOLD = bot.config["SIX_VS_SIX_THRESHOLD"]
+        # room threads are created in the background ahead of demand, outside of /c;
+        # thread creation is rate limited per channel, so every queue has its own
+        for queue in self.queues.values():
+            queue.provisioner = ThreadProvisioner(
+                self.create_room_thread, self.add_room, self.report_room_thread_error)
 
-        # number of minutes before scheduled time that queue should open
-        self.QUEUE_OPEN_TIME = timedelta(minutes=bot.config["QUEUE_OPEN_TIME"])
-
-        # number of minutes after QUEUE_OPEN_TIME that teams can join the mogi
-        self.JOINING_TIME = timedelta(minutes=bot.config["JOINING_TIME"])
-
-        # number of minutes after JOINING_TIME for any potential extra teams to join
-        self.EXTENSION_TIME = timedelta(minutes=bot.config["EXTENSION_TIME"])
+        # one pooled client shared by every Lounge API call, closed in cog_unload
+        self.lounge_client = LoungeClient.from_config(bot.config)
 
         with open('./timezones.json', 'r') as cjson:
             self.timezones = json.load(cjson)
 
+        # warm start from the last saved player list so /c works before
+        # the first refresh finishes; loads while the gateway connects
+        self._snapshot_load = asyncio.create_task(lounge_data.load_snapshot(
+            bot.config.get("lounge_snapshot_path", "./data/lounge_snapshot.pickle")))
+
+        # every change to the queue state is journaled, so a crash or redeploy
+        # picks up where it left off; the objects are rebuilt in on_ready
+        self.journal = Journal(bot.config.get("journal_path", "./data/journal"))
+        self._recovered_state = self.journal.recover()
+
+        # opt-in recording of the queue's traffic for tools/replay.py, see recorder.py
+        self.recorder = None
+        if bot.config.get("record_path"):
+            self.recorder = Recorder(bot.config["record_path"], bot.config, self.journal.state)
+            self.deadlines.on_run = self.recorder.tick
+
+        # on_ready runs again after every gateway reconnect, setup only runs once
+        self._initialized = False
+        self._started_at = time.monotonic()
+        self._first_join_reported = False
+
+        # optional local Prometheus endpoint, see metrics.py
+        metrics_port = bot.config.get("metrics_port")
+        self.metrics_server = None
+        if metrics_port:
+            self.metrics_server = MetricsServer(metrics_port, bot.config.get("metrics_host", "127.0.0.1"))
+        metrics.add_collector(self.collect_metrics)
+
+    async def cog_unload(self):
+        await self.lounge_client.close()
+        await self.outbound.close()
+        for queue in self.queues.values():
+            queue.provisioner.close()
+        self.deadlines.close()
+        self.journal.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        metrics.remove_collector(self.collect_metrics)
+        if self.metrics_server is not None:
+            await self.metrics_server.close()
+
     @commands.Cog.listener()
     async def on_ready(self):
-        self.GUILD = self.bot.get_guild(self.bot.config["guild_id"])
-        self.MOGI_CHANNEL = self.bot.get_channel(
-            self.bot.config["queue_join_channel"])
-        self.SUB_CHANNEL = self.bot.get_channel(
-            self.bot.config["queue_sub_channel"])
-        self.LIST_CHANNEL = self.bot.get_channel(
-            self.bot.config["queue_list_channel"])
-        self.HISTORY_CHANNEL = self.bot.get_channel(
-            self.bot.config["queue_history_channel"])
-        try:
-            await self.LIST_CHANNEL.purge()
-        except:
-            print("Purging List channel failed", flush=True)
-        try:
-            await self.SUB_CHANNEL.purge()
-        except:
-            print("Purging Sub channel failed", flush=True)
-        print(f"Server - {self.GUILD}", flush=True)
-        print(f"Join Channel - {self.MOGI_CHANNEL}", flush=True)
-        print(f"Sub Channel - {self.SUB_CHANNEL}", flush=True)
-        print(f"List Channel - {self.LIST_CHANNEL}", flush=True)
-        print(f"History Channel - {self.HISTORY_CHANNEL}", flush=True)
-        print("Ready!", flush=True)
+        if self._initialized:
+            print("Reconnected", flush=True)
+            return
+        self._initialized = True
+        if self.metrics_server is not None:
+            metrics.instrument_discord_http(self.bot.http)
+            try:
+                await self.metrics_server.start()
+            except Exception as e:
+                print(f"Starting the metrics server failed: {e}", flush=True)
+        for queue in self.queues.values():
+            queue.resolve_channels(self.bot)
+        results = await asyncio.gather(self._snapshot_load,
+                                       self.restore_state(self._recovered_state),
+                                       self.clean_owned_messages(),
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print(result, flush=True)
+        self._recovered_state = None
+        for queue in self.queues.values():
+            self.plan_next_mogi(queue)
+            print(f"Queue {queue.name}:", flush=True)
+            print(f"Server - {queue.GUILD}", flush=True)
+            print(f"Join Channel - {queue.MOGI_CHANNEL}", flush=True)
+            print(f"Sub Channel - {queue.SUB_CHANNEL}", flush=True)
+            print(f"List Channel - {queue.LIST_CHANNEL}", flush=True)
+            print(f"History Channel - {queue.HISTORY_CHANNEL}", flush=True)
+        print(f"Ready! Startup took {time.monotonic() - self._started_at:.2f}s", flush=True)
+
+    def collect_metrics(self):
+        metrics.OUTBOUND_DEPTH.set(self.outbound.depth())
+        for queue in self.queues.values():
+            mogi = queue.ongoing
+            teams = len(mogi.teams) if mogi is not None else 0
+            confirmed = mogi.count_registered() if mogi is not None else 0
+            metrics.QUEUE_TEAMS.set(teams, queue=queue.name)
+            metrics.QUEUE_CONFIRMED_TEAMS.set(confirmed, queue=queue.name)
+
+    # command latency: slash commands are timed from the cog's check to the
+    # completion event, prefix commands by the cog's invoke hooks
+    async def interaction_check(self, interaction: discord.Interaction):
+        interaction.extras["started_at"] = time.perf_counter()
+        if self.recorder is not None and interaction.command.name in RECORDED_COMMANDS:
+            self.record_command(interaction)
+        return True
+
+    @commands.Cog.listener()
+    async def on_app_command_completion(self, interaction, command):
+        started_at = interaction.extras.get("started_at")
+        if started_at is not None:
+            metrics.COMMAND_LATENCY.observe(time.perf_counter() - started_at,
+                                            command=command.qualified_name)
+
+    async def cog_before_invoke(self, ctx):
+        ctx.started_at = time.perf_counter()
+
+    async def cog_after_invoke(self, ctx):
+        metrics.COMMAND_LATENCY.observe(time.perf_counter() - ctx.started_at,
+                                        command=ctx.command.qualified_name)
+
+    def describe_channel(self, channel_id):
+        """The channel id, or [mogi key, room number] for a room thread."""
+        if channel_id in self.room_threads:
+            mogi, room = self.room_threads[channel_id]
+            return [mogi_key(mogi), room.room_num]
+        return channel_id
+
+    def record_command(self, interaction):
+        user = interaction.user
+        lounge_name = mmr = None
+        if interaction.command.name == "c":
+            player = lounge_data.find_by_discord_id(user.id)
+            if player is not None:
+                lounge_name, mmr = player.name, player.mmr
+        self.recorder.record("cmd", interaction.command.name, user.id, user.display_name,
+                             self.describe_channel(interaction.channel_id), lounge_name, mmr)
+
+    def record_vote(self, interaction, format_name):
+        user = interaction.user
+        self.recorder.record("vote", user.id, user.display_name,
+                             self.describe_channel(interaction.channel_id), format_name)
+
+    async def clean_owned_messages(self):
+        """Deletes the list and sub channel messages left over from before a
+        restart.  Sub requests go too, even if they haven't expired: their
+        Join Room buttons stopped working with the restart."""
+        if not self.journal.restored:
+            # nothing was tracked yet, so fall back to clearing the channels
+            channels = {channel for queue in self.queues.values()
+                        for channel in (queue.LIST_CHANNEL, queue.SUB_CHANNEL) if channel is not None}
+            for channel in channels:
+                try:
+                    await channel.purge()
+                except Exception as e:
+                    print(f"Purging {channel} failed: {e}", flush=True)
+            return
+        now = time.time()
+        stale = {}
+        gone = []
+        for message_id, (channel_id, expires_at) in self.journal.owned_messages().items():
+            if expires_at is not None and expires_at <= now:
+                # Discord has deleted it already
+                gone.append(message_id)
+                continue
+            stale.setdefault(channel_id, []).append(message_id)
+        self.journal.disown_messages(gone)
+        for channel_id, message_ids in stale.items():
+            channel = self.bot.get_channel(channel_id)
+            if channel is not None:
+                await self.bulk_delete(channel, message_ids)
+            self.journal.disown_messages(message_ids)
+
+    async def bulk_delete(self, channel, message_ids):
+        # bulk deletes are refused for messages older than 14 days, so those go one by one
+        oldest = discord.utils.time_snowflake(datetime.now(timezone.utc) - timedelta(days=14))
+        recent = [message_id for message_id in message_ids if message_id >= oldest]
+        for message_id in [message_id for message_id in message_ids if message_id < oldest]:
+            try:
+                await channel.get_partial_message(message_id).delete()
+            except discord.NotFound:
+                pass
+            except Exception as e:
+                print(f"Deleting old message in {channel} failed: {e}", flush=True)
+        # at most 100 messages per bulk delete; messages already gone are ignored
+        for i in range(0, len(recent), 100):
+            chunk = [discord.Object(id=message_id) for message_id in recent[i:i+100]]
+            try:
+                await channel.delete_messages(chunk)
+            except discord.NotFound:
+                pass
+            except Exception as e:
+                print(f"Deleting old messages in {channel} failed: {e}", flush=True)
+
+    def own_message(self, future, expires_after=None):
+        """Tracks a message queued in the list or sub channel once it is sent."""
+        def record(future):
+            if future.cancelled() or future.exception() is not None:
+                return
+            expires_at = time.time() + expires_after if expires_after else None
+            self.journal.own_message(future.result(), expires_at)
+            if expires_after:
+                self.disown_later(future.result().id, expires_after)
+        future.add_done_callback(record)
+
+    def disown_later(self, message_id, delay):
+        """Drops a message that deletes itself from the journal once it is gone."""
+        asyncio.get_running_loop().call_later(delay, self.journal.disown_messages, [message_id])
 
     async def lockdown(self, channel: discord.TextChannel):
         # everyone_perms = channel.permissions_for(channel.guild.default_role)
@@ -103,7 +256,7 @@ class SquadQueue(commands.Cog):
         overwrite = channel.overwrites_for(channel.guild.default_role)
         overwrite.send_messages = False
         await channel.set_permissions(channel.guild.default_role, overwrite=overwrite)
-        await channel.send("Locked down " + channel.mention)
+        self.outbound.send(channel, "Locked down " + channel.mention)
 
     async def unlockdown(self, channel: discord.TextChannel):
         # everyone_perms = channel.permissions_for(channel.guild.default_role)
@@ -112,45 +265,37 @@ class SquadQueue(commands.Cog):
         overwrite = channel.overwrites_for(channel.guild.default_role)
         overwrite.send_messages = None
         await channel.set_permissions(channel.guild.default_role, overwrite=overwrite)
-        await channel.send("Unlocked " + channel.mention)
+        self.outbound.send(channel, "Unlocked " + channel.mention)
 
-    # either adds a message to the message queue or sends it, depending on
-    # server settings
+    # either adds a message to the outbound queue, where it is combined with
+    # other small messages for the channel, or sends it, depending on server settings
     async def queue_or_send(self, ctx, msg, delay=0):
         if ctx.bot.config["queue_messages"] is True:
-            if ctx.channel not in self.msg_queue.keys():
-                self.msg_queue[ctx.channel] = []
-            self.msg_queue[ctx.channel].append(msg)
+            self.outbound.send(ctx.channel, msg, coalesce=True)
         else:
             sendmsg = await ctx.send(msg)
             if delay > 0:
                 await sendmsg.delete(delay=delay)
 
-    # goes thru the msg queue for each channel and combines them
-    # into as few messsages as possible, then sends them
-    @tasks.loop(seconds=2)
-    async def send_queued_messages(self):
-        try:
-            for channel in self.msg_queue.keys():
-                channel_queue = self.msg_queue[channel]
-                sentmsgs = []
-                msg = ""
-                for i in range(len(channel_queue)-1, -1, -1):
-                    msg = channel_queue.pop(i) + "\n" + msg
-                    if len(msg) > 1500:
-                        sentmsgs.append(msg)
-                        msg = ""
-                if len(msg) > 0:
-                    sentmsgs.append(msg)
-                for i in range(len(sentmsgs)-1, -1, -1):
-                    await channel.send(sentmsgs[i])
-        except Exception as e:
-            print(e)
+    def get_queue(self, ctx):
+        return self.queues_by_channel.get(ctx.channel.id)
+
+    def queue_of(self, mogi):
+        return self.queues_by_channel[mogi.mogi_channel.id]
+
+    def queues_for(self, ctx):
+        """The queue of the channel, or every queue of the server when used
+        outside of a join channel."""
+        queue = self.get_queue(ctx)
+        if queue is not None:
+            return [queue]
+        return [queue for queue in self.queues.values() if queue.guild_id == ctx.guild.id]
 
     def get_mogi(self, ctx):
-        if ctx.channel in self.ongoing_events.keys():
-            return self.ongoing_events[ctx.channel]
-        return None
+        queue = self.get_queue(ctx)
+        if queue is None:
+            return None
+        return queue.ongoing
 
     async def is_started(self, ctx, mogi):
         if not mogi.started:
@@ -164,125 +309,126 @@ class SquadQueue(commands.Cog):
             return False
         return True
 
+    # /c, /d and /remove_player only change the mogi while holding its lock;
+    # every discord call happens after the lock is released
     @app_commands.command(name="c")
     @app_commands.guild_only()
     async def can(self, interaction: discord.Interaction):
         """Join a mogi"""
         await interaction.response.defer()
-        async with self.LOCK:
-            member = interaction.user
-            mogi = self.get_mogi(interaction)
-            if mogi is None or not mogi.started or not mogi.gathering:
-                await interaction.followup.send("Queue has not started yet.")
-                return
-
-            player_team = mogi.check_player(member)
-
-            if player_team is not None:
-                await interaction.followup.send(f"{interaction.user.mention} is already signed up.")
-                return
+        member = interaction.user
+        queue = self.get_queue(interaction)
+        mogi = self.get_mogi(interaction)
+        if mogi is None or not mogi.started or not mogi.gathering:
+            await interaction.followup.send("Queue has not started yet.")
+            return
 
-            # players = await mk8dx_150cc_mmr(self.URL, [member])
-            player_api_result = discord.utils.find(
-                lambda player: player['discordId'] == str(member.id), lounge_data.data())
+        player_api_result = lounge_data.find_by_discord_id(member.id)
+        # new players play at the starting MMR, so that is what the queue's range is checked against
+        starting_player_mmr = 1500
+        if player_api_result and player_api_result.mmr is not None:
+            effective_mmr = player_api_result.mmr
+        else:
+            effective_mmr = starting_player_mmr
 
-            if not player_api_result:
-            # if len(players) == 0 or players[0] is None:
+        closed = False
+        joined = False
+        async with metrics.timed_lock(mogi.lock, "join"):
+            if not mogi.gathering:
+                msg = "Queue has not started yet."
+            elif mogi.check_player(member) is not None:
+                msg = f"{interaction.user.mention} is already signed up."
+            elif not player_api_result:
                 msg = f"{interaction.user.mention} fetch for MMR has failed and joining the queue was unsuccessful.  "
                 msg += "Please try again.  If the problem continues then contact a staff member for help."
-                await interaction.followup.send(msg)
-                return
-
-            player = Player(
-                member, player_api_result['name'], player_api_result['mmr'] if 'mmr' in player_api_result else None)
-
-            msg = ""
-            if player.mmr is None:
-                starting_player_mmr = 1500
-                player.mmr = starting_player_mmr
-                msg += f"{player.lounge_name} is assumed to be a new player and will be playing this mogi with a starting MMR of {starting_player_mmr}.  "
-                msg += "If you believe this is a mistake, please contact a staff member for help.\n"
-
-            player.confirmed = True
-            squad = Team([player])
-
-            # if players[0].mmr is None:
-            #     starting_player_mmr = 1500
-            #     players[0].mmr = starting_player_mmr
-            #     msg += f"{players[0].lounge_name} is assumed to be a new player and will be playing this mogi with a starting MMR of {starting_player_mmr}.  "
-            #     msg += "If you believe this is a mistake, please contact a staff member for help.\n"
-
-            # players[0].confirmed = True
-            # squad = Team(players)
-
-            mogi.teams.append(squad)
-
-            msg += f"{player.lounge_name} joined queue for mogi {discord.utils.format_dt(mogi.start_time, style='R')}, `[{mogi.count_registered()} players]`"
-            # msg += f"{players[0].lounge_name} joined queue for mogi {discord.utils.format_dt(mogi.start_time, style='R')}, `[{mogi.count_registered()} players]`"
+            elif not queue.accepts(effective_mmr):
+                msg = f"{interaction.user.mention} is outside of the MMR range of this queue."
+            else:
+                player = Player(
+                    member, player_api_result.name, player_api_result.mmr)
 
-            await interaction.followup.send(msg)
-            await self.check_room_channels(mogi)
-            await self.check_num_teams(mogi)
+                msg = ""
+                if player.mmr is None:
+                    player.mmr = starting_player_mmr
+                    msg += f"{player.lounge_name} is assumed to be a new player and will be playing this mogi with a starting MMR of {starting_player_mmr}.  "
+                    msg += "If you believe this is a mistake, please contact a staff member for help.\n"
+
+                player.confirmed = True
+                squad = Team([player])
+                mogi.add_team(squad)
+                self.journal.join(mogi, squad)
+                joined = True
+
+                msg += f"{player.lounge_name} joined queue for mogi {discord.utils.format_dt(mogi.start_time, style='R')}, `[{mogi.count_registered()} players]`"
+
+                self.check_room_channels(mogi)
+                closed = self.check_num_teams(mogi)
+                if closed:
+                    self.save_mogi(mogi)
+
+        await interaction.followup.send(msg)
+        if joined:
+            self.request_list_update(queue)
+        if joined and not self._first_join_reported:
+            self._first_join_reported = True
+            print(f"First /c accepted {time.monotonic() - self._started_at:.2f}s after startup", flush=True)
+        if closed:
+            await self.announce_enough_teams(mogi)
 
     @app_commands.command(name="d")
     @app_commands.guild_only()
     async def drop(self, interaction: discord.Interaction):
         """Remove user from mogi"""
         await interaction.response.defer()
-        async with self.LOCK:
-            mogi = self.get_mogi(interaction)
-            if mogi is None or not mogi.started or not mogi.gathering:
-                await interaction.followup.send("Queue has not started yet.")
-                return
+        mogi = self.get_mogi(interaction)
+        if mogi is None or not mogi.started or not mogi.gathering:
+            await interaction.followup.send("Queue has not started yet.")
+            return
 
-            member = interaction.user
+        member = interaction.user
+        async with metrics.timed_lock(mogi.lock, "drop"):
             squad = mogi.check_player(member)
-            if squad is None:
-                await interaction.followup.send(f"{member.display_name} is not currently in this event; type `/c` to join")
-                return
-            mogi.teams.remove(squad)
-            msg = "Removed "
-            msg += ", ".join([p.lounge_name for p in squad.players])
-            msg += f" from the mogi {discord.utils.format_dt(mogi.start_time, style='R')}"
-            msg += f", `[{mogi.count_registered()} players]`"
+            if not mogi.gathering:
+                msg = "Queue has not started yet."
+            elif squad is None:
+                msg = f"{member.display_name} is not currently in this event; type `/c` to join"
+            else:
+                mogi.remove_team(squad)
+                self.journal.drop(mogi, squad)
+                self.request_list_update(self.queue_of(mogi))
+                msg = "Removed "
+                msg += ", ".join([p.lounge_name for p in squad.players])
+                msg += f" from the mogi {discord.utils.format_dt(mogi.start_time, style='R')}"
+                msg += f", `[{mogi.count_registered()} players]`"
 
-            await interaction.followup.send(msg)
+        await interaction.followup.send(msg)
 
     @app_commands.command(name="sub")
     @app_commands.guild_only()
     async def sub(self, interaction: discord.Interaction):
         """Sends out a request for a sub in the sub channel. Only works in thread channels for SQ rooms."""
-        is_room_thread = False
-        room = None
-        for mogi in self.ongoing_events.values():
-            if mogi.is_room_thread(interaction.channel_id):
-                room = mogi.get_room_from_thread(interaction.channel_id)
-                is_room_thread = True
-                break
-        for mogi in self.old_events.values():
-            if mogi.is_room_thread(interaction.channel.id):
-                room = mogi.get_room_from_thread(interaction.channel.id)
-                is_room_thread = True
-                break
-        if not is_room_thread:
-            await interaction.response.send_message(f"More than {self.MOGI_LIFETIME} minutes have passed since mogi start, the Mogi Object has been deleted.", ephemeral=True)
+        if interaction.channel_id not in self.room_threads:
+            await interaction.response.send_message(f"More than {self.bot.config['MOGI_LIFETIME']} minutes have passed since mogi start, the Mogi Object has been deleted.", ephemeral=True)
             return
+        mogi, room = self.room_threads[interaction.channel_id]
+        queue = self.queue_of(mogi)
         msg = "<@&682445864400453739> - "
         if room.room_num == 1:
             msg += f"Room {room.room_num} is looking for a sub with mmr >{room.mmr_low - 500}\n"
         else:
             low = 0 if room.mmr_low < 500 else room.mmr_low - 500
             msg += f"Room {room.room_num} is looking for a sub with range {low}-{room.mmr_high + 500}\n"
+        lifetime = queue.SUB_MESSAGE_LIFETIME_SECONDS
         message_delete_date = datetime.now(
-            timezone.utc) + timedelta(seconds=self.SUB_MESSAGE_LIFETIME_SECONDS)
+            timezone.utc) + timedelta(seconds=lifetime)
         msg += f"Message will auto-delete in {discord.utils.format_dt(message_delete_date, style='R')}"
-        await self.SUB_CHANNEL.send(msg, delete_after=self.SUB_MESSAGE_LIFETIME_SECONDS)
-        view = JoinView(room, get_mmr_from_discord_id)
-        await self.SUB_CHANNEL.send(view=view, delete_after=self.SUB_MESSAGE_LIFETIME_SECONDS)
+        self.own_message(self.outbound.send(queue.SUB_CHANNEL, msg, delete_after=lifetime), lifetime)
+        view = JoinView(room, self.lounge_client.get_mmr_from_discord_id)
+        self.own_message(self.outbound.send(queue.SUB_CHANNEL, view=view, delete_after=lifetime), lifetime)
         await interaction.response.send_message("Sent out request for sub.")
 
     @app_commands.command(name="l")
-    @app_commands.checks.cooldown(1, 120, key=lambda i: (i.channel.id))
+    @app_commands.checks.cooldown(1, 30, key=lambda i: (i.channel.id))
     @app_commands.guild_only()
     async def list(self, interaction: discord.Interaction):
         """Display the list of confirmed players for a mogi"""
@@ -292,151 +438,106 @@ class SquadQueue(commands.Cog):
             return
         if not await self.is_started(interaction, mogi):
             return
-        mogi_list = mogi.confirmed_list()
-        if len(mogi_list) == 0:
+        if mogi.count_registered() == 0:
             await interaction.response.send_message(f"There are no players in the queue - type `/c` to join")
             return
 
-        sorted_mogi_list = sorted(mogi_list, reverse=True)
-        msg = "Current Mogi List:\n"
-        for i in range(len(sorted_mogi_list)):
-            msg += f"{i+1}) "
-            msg += ", ".join([p.lounge_name for p in sorted_mogi_list[i].players])
-            msg += f" ({sorted_mogi_list[i].avg_mmr:.1f} MMR)\n"
-        if (len(sorted_mogi_list) % (12/mogi.size) != 0):
-            num_next = int(len(sorted_mogi_list) % (12/mogi.size))
-            teams_per_room = int(12/mogi.size)
-            num_rooms = int(len(sorted_mogi_list) / (12/mogi.size))+1
-            msg += f"[{num_next}/{teams_per_room}] players for {num_rooms} room(s)"
-        message = msg.split("\n")
-        bulk_msg = ""
-        for i in range(len(message)):
-            if len(bulk_msg + message[i] + "\n") > 2000:
-                await interaction.channel.send(bulk_msg) if interaction.response.is_done() else await interaction.response.send_message(bulk_msg)
-                bulk_msg = ""
-            bulk_msg += message[i] + "\n"
-        if len(bulk_msg) > 0:
-            await interaction.channel.send(bulk_msg) if interaction.response.is_done() else await interaction.response.send_message(bulk_msg)
+        chunks = self.get_queue(interaction).list_renderer.render(mogi)
+        for chunk in chunks:
+            await interaction.channel.send(chunk) if interaction.response.is_done() else await interaction.response.send_message(chunk)
 
     @list.error  # Tell the user when they've got a cooldown
     async def on_list_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
         if isinstance(error, app_commands.CommandOnCooldown):
             await interaction.response.send_message("Wait before using `/l` command", ephemeral=True)
 
-    @tasks.loop(seconds=30)
-    async def list_task(self):
-        """Continually display the list of confirmed players for a mogi in the history channel"""
-        if len(self.ongoing_events) > 0:
-            for mogi in self.ongoing_events.values():
-                if not mogi.gathering:
-                    await self.delete_list_messages(0)
-                    return
-
-                mogi.update_late_players()
-
-                mogi_list = mogi.confirmed_list()
-
-                sorted_mogi_list = sorted(mogi_list, reverse=True)
-                msg = f"**Last Updated:** {discord.utils.format_dt(datetime.now(timezone.utc), style='R')}\n\n"
-                msg += "Current Mogi List:\n"
-                for i in range(len(sorted_mogi_list)):
-                    msg += f"{i+1}) "
-                    msg += ", ".join([p.lounge_name for p in sorted_mogi_list[i].players])
-                    is_late_player = sorted_mogi_list[i].get_lateness()
-                    msg += f" ({sorted_mogi_list[i].players[0].mmr} MMR)"
-                    if is_late_player:
-                        msg += " (late)\n"
-                    else:
-                        msg += "\n"
-                    if ((i + 1) % 12 == 0):
-                        msg += "ㅤ\n"
-                if (len(sorted_mogi_list) % (12/mogi.size) != 0):
-                    num_next = int(len(sorted_mogi_list) % (12/mogi.size))
-                    teams_per_room = int(12/mogi.size)
-                    num_rooms = int(len(sorted_mogi_list) / (12/mogi.size))+1
-                    msg += f"[{num_next}/{teams_per_room}] players for {num_rooms} room(s)"
-                message = msg.split("\n")
-
-                new_messages = []
-                bulk_msg = ""
-                for i in range(len(message)):
-                    if len(bulk_msg + message[i] + "\n") > 2000:
-                        new_messages.append(bulk_msg)
-                        bulk_msg = ""
-                    bulk_msg += message[i] + "\n"
-                if len(bulk_msg) > 0 and bulk_msg != "\n":
-                    new_messages.append(bulk_msg)
-
-                await self.delete_list_messages(len(new_messages))
+    def request_list_update(self, queue):
+        """Refreshes the queue's list channel after a change, at most once per LIST_UPDATE_INTERVAL."""
+        key = ("list", queue.name)
+        if self.deadlines.when(key) is not None:
+            return
+        when = max(datetime.now(timezone.utc),
+                   queue.list_updated_at + timedelta(seconds=queue.LIST_UPDATE_INTERVAL))
+        self.deadlines.schedule(key, when, partial(self.update_list, queue))
+
+    async def update_list(self, queue):
+        """Display the list of confirmed players for a mogi in the list channel"""
+        queue.list_updated_at = datetime.now(timezone.utc)
+        mogi = queue.ongoing
+        if mogi is None or not mogi.gathering:
+            await self.delete_list_messages(queue, 0)
+            return
 
-                try:
-                    for i, message in enumerate(new_messages):
-                        if i < len(self.list_messages):
-                            old_message = self.list_messages[i]
-                            await old_message.edit(content=message)
-                        else:
-                            new_message = await self.LIST_CHANNEL.send(message)
-                            self.list_messages.append(new_message)
-                except:
-                    await self.delete_list_messages(0)
-                    for i, message in enumerate(new_messages):
-                        new_message = await self.LIST_CHANNEL.send(message)
-                        self.list_messages.append(new_message)
-        else:
-            await self.delete_list_messages(0)
+        written = (mogi, mogi.version)
+        chunks = queue.list_renderer.render(mogi)
+        if queue.list_written == written and len(queue.list_messages) == len(chunks):
+            return
+
+        header = f"**Last Updated:** {discord.utils.format_dt(datetime.now(timezone.utc), style='R')}\n\n"
+        new_messages = [header + chunks[0]] + chunks[1:]
 
-    async def delete_list_messages(self, new_list_size: int):
+        await self.delete_list_messages(queue, len(new_messages))
+
+        try:
+            for i, message in enumerate(new_messages):
+                if i < len(queue.list_messages):
+                    # only edit the chunks whose content actually changed
+                    if queue.list_message_contents[i] != message:
+                        await queue.list_messages[i].edit(content=message)
+                        queue.list_message_contents[i] = message
+                else:
+                    new_message = await self.outbound.send(queue.LIST_CHANNEL, message)
+                    self.journal.own_message(new_message)
+                    queue.list_messages.append(new_message)
+                    queue.list_message_contents.append(message)
+        except:
+            await self.delete_list_messages(queue, 0)
+            for i, message in enumerate(new_messages):
+                new_message = await self.outbound.send(queue.LIST_CHANNEL, message)
+                self.journal.own_message(new_message)
+                queue.list_messages.append(new_message)
+                queue.list_message_contents.append(message)
+        queue.list_written = written
+
+    async def delete_list_messages(self, queue, new_list_size: int):
         try:
             messages_to_delete = []
-            while len(self.list_messages) > new_list_size:
-                messages_to_delete.append(self.list_messages.pop())
-            if self.LIST_CHANNEL and len(messages_to_delete) > 0:
-                await self.LIST_CHANNEL.delete_messages(messages_to_delete)
+            while len(queue.list_messages) > new_list_size:
+                messages_to_delete.append(queue.list_messages.pop())
+                queue.list_message_contents.pop()
+            if queue.LIST_CHANNEL and len(messages_to_delete) > 0:
+                await queue.LIST_CHANNEL.delete_messages(messages_to_delete)
+                self.journal.disown_messages([message.id for message in messages_to_delete])
         except Exception as e:
             print(e, flush=True)
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
-        if message.author.bot or not (message.content.isdecimal() and 12 <= int(message.content) <= 180):
-            return
-        mogi = discord.utils.find(lambda mogi: mogi.is_room_thread(
-            message.channel.id), self.ongoing_events.values())
-        if not mogi:
-            mogi = discord.utils.find(lambda mogi: mogi.is_room_thread(
-                message.channel.id), self.old_events.values())
-            if not mogi:
-                return
-        room = discord.utils.find(
-            lambda room: room.thread.id == message.channel.id, mogi.rooms)
-        if not room or not room.teams:
+        if message.author.bot or message.channel.id not in self.room_threads:
             return
-        team = discord.utils.find(
-            lambda team: team.has_player(message.author), room.teams)
-        if not team:
+        if self.recorder is not None:
+            self.recorder.record("msg", message.author.id, message.author.display_name,
+                                 self.describe_channel(message.channel.id), message.content)
+        if not (message.content.isdecimal() and 12 <= int(message.content) <= 180):
             return
-        player = discord.utils.find(
-            lambda player: player.member.id == message.author.id, team.players)
+        mogi, room = self.room_threads[message.channel.id]
+        player = room.players.get(message.author.id)
         if player:
             player.score = int(message.content)
+            self.journal.score(mogi, room, player)
 
     @app_commands.command(name="scoreboard")
     @app_commands.guild_only()
     async def scoreboard(self, interaction: discord.Interaction):
         """Displays the scoreboard of the room. Only works in thread channels for SQ rooms."""
 
-        mogi = discord.utils.find(lambda mogi: mogi.is_room_thread(
-            interaction.channel_id), self.ongoing_events.values())
-        if not mogi:
-            mogi = discord.utils.find(lambda mogi: mogi.is_room_thread(
-                interaction.channel_id), self.old_events.values())
-            if not mogi:
-                await interaction.response.send_message(f"The Mogi object cannot be found.", ephemeral=True)
-                return
+        if interaction.channel_id not in self.room_threads:
+            await interaction.response.send_message(f"The Mogi object cannot be found.", ephemeral=True)
+            return
 
-        room = discord.utils.find(
-            lambda room: room.thread.id == interaction.channel_id, mogi.rooms)
+        mogi, room = self.room_threads[interaction.channel_id]
 
-        if not room:
+        if not room.teams:
             await interaction.response.send_message(f"The Thread object cannot be found.", ephemeral=True)
             return
 
@@ -455,35 +556,45 @@ class SquadQueue(commands.Cog):
     async def remove_player(self, interaction: discord.Interaction, member: discord.Member):
         """Removes a specific player from the current queue.  Staff use only."""
         await interaction.response.defer()
-        async with self.LOCK:
-            mogi = self.get_mogi(interaction)
-            if mogi is None or not mogi.started or not mogi.gathering:
-                await interaction.followup.send("Queue has not started yet.")
-                return
+        mogi = self.get_mogi(interaction)
+        if mogi is None or not mogi.started or not mogi.gathering:
+            await interaction.followup.send("Queue has not started yet.")
+            return
 
+        async with metrics.timed_lock(mogi.lock, "remove_player"):
             squad = mogi.check_player(member)
-            if squad is None:
-                await interaction.followup.send(f"{member.display_name} is not currently in this event; type `/c` to join")
-                return
-            mogi.teams.remove(squad)
-            msg = "Staff has removed "
-            msg += ", ".join([p.lounge_name for p in squad.players])
-            msg += f" from the mogi {discord.utils.format_dt(mogi.start_time, style='R')}"
-            msg += f", `[{mogi.count_registered()} players]`"
+            if not mogi.gathering:
+                msg = "Queue has not started yet."
+            elif squad is None:
+                msg = f"{member.display_name} is not currently in this event; type `/c` to join"
+            else:
+                mogi.remove_team(squad)
+                self.journal.drop(mogi, squad)
+                self.request_list_update(self.queue_of(mogi))
+                msg = "Staff has removed "
+                msg += ", ".join([p.lounge_name for p in squad.players])
+                msg += f" from the mogi {discord.utils.format_dt(mogi.start_time, style='R')}"
+                msg += f", `[{mogi.count_registered()} players]`"
 
-            await interaction.followup.send(msg)
+        await interaction.followup.send(msg)
 
     @app_commands.command(name="annul_current_mogi")
     @app_commands.guild_only()
     async def annul_current_mogi(self, interaction: discord.Interaction):
         """The mogi currently gathering will be deleted.  The queue resumes at the next hour.  Staff use only."""
-        self.scheduled_events = {}
-        self.ongoing_events = {}
         curr_time = datetime.now(timezone.utc)
         truncated_time = curr_time.replace(
             minute=0, second=0, microsecond=0)
-        self.QUEUE_TIME_BLOCKER = truncated_time + timedelta(hours=1)
-        await self.lockdown(self.MOGI_CHANNEL)
+        for queue in self.queues_for(interaction):
+            self.clear_scheduled_events(queue)
+            if queue.ongoing is not None:
+                self.forget_mogis([queue.ongoing])
+                queue.ongoing = None
+            queue.QUEUE_TIME_BLOCKER = truncated_time + timedelta(hours=1)
+            self.save_settings(queue)
+            self.plan_next_mogi(queue)
+            self.request_list_update(queue)
+            await self.lockdown(queue.MOGI_CHANNEL)
         await interaction.response.send_message("The current Mogi has been canceled, the queue will resume at the next hour.")
 
     @app_commands.command(name="pause_mogi_scheduling")
@@ -491,7 +602,10 @@ class SquadQueue(commands.Cog):
     async def pause_mogi_scheduling(self, interaction: discord.Interaction):
         """The mogi that is currently gathering will continue to work.  Future mogis cannot be scheduled.  Staff use only."""
         curr_time = datetime.now(timezone.utc)
-        self.QUEUE_TIME_BLOCKER = curr_time + timedelta(weeks=52)
+        for queue in self.queues_for(interaction):
+            queue.QUEUE_TIME_BLOCKER = curr_time + timedelta(weeks=52)
+            self.save_settings(queue)
+            self.plan_next_mogi(queue)
         await interaction.response.send_message("Future Mogis will not be started.")
 
     @app_commands.command(name="resume_mogi_scheduling")
@@ -499,18 +613,27 @@ class SquadQueue(commands.Cog):
     async def resume_mogi_scheduling(self, interaction: discord.Interaction):
         """Mogis will begin to be scheduled again.  Staff use only."""
         curr_time = datetime.now(timezone.utc)
-        self.QUEUE_TIME_BLOCKER = curr_time
+        for queue in self.queues_for(interaction):
+            queue.QUEUE_TIME_BLOCKER = curr_time
+            self.save_settings(queue)
+            self.plan_next_mogi(queue)
         await interaction.response.send_message("Mogis will resume scheduling.")
 
     @app_commands.command(name="reset_bot")
     @app_commands.guild_only()
     async def reset_bot(self, interaction: discord.Interaction):
         """Resets the bot.  Staff use only."""
-        self.scheduled_events = {}
-        self.ongoing_events = {}
-        self.old_events = {}
         curr_time = datetime.now(timezone.utc)
-        self.QUEUE_TIME_BLOCKER = curr_time
+        for queue in self.queues_for(interaction):
+            self.clear_scheduled_events(queue)
+            self.forget_mogis([mogi for mogi in [queue.ongoing] if mogi is not None])
+            self.forget_mogis(queue.old.values())
+            queue.ongoing = None
+            queue.old = {}
+            queue.QUEUE_TIME_BLOCKER = curr_time
+            self.save_settings(queue)
+            self.plan_next_mogi(queue)
+            self.request_list_update(queue)
         await interaction.response.send_message("All events have been deleted.  Queue will restart shortly.")
 
     @commands.command(name="schedule_sq_times")
@@ -539,10 +662,13 @@ class SquadQueue(commands.Cog):
             new_sq_dates.append(truncated_date)
             msg += f"{truncated_date}\n"
 
-        self.sq_times += new_sq_dates
-        self.sq_times = list(set(self.sq_times))
+        for queue in self.queues_for(ctx):
+            queue.sq_times += new_sq_dates
+            queue.sq_times = list(set(queue.sq_times))
 
-        list.sort(self.sq_times)
+            list.sort(queue.sq_times)
+            self.save_settings(queue)
+            self.plan_next_mogi(queue)
 
         await self.queue_or_send(ctx, msg)
 
@@ -552,8 +678,11 @@ class SquadQueue(commands.Cog):
         """Peeks the current list of sq times.  Staff use only."""
         msg = "List of Squad Queue Times:\n"
 
-        for index, date in enumerate(self.sq_times):
-            msg += f"{index + 1}) {date}\n"
+        for queue in self.queues_for(interaction):
+            if len(self.queues) > 1:
+                msg += f"**{queue.name}**\n"
+            for index, date in enumerate(queue.sq_times):
+                msg += f"{index + 1}) {date}\n"
 
         await interaction.response.send_message(msg)
 
@@ -561,7 +690,9 @@ class SquadQueue(commands.Cog):
     @app_commands.guild_only()
     async def clear_sq_times(self, interaction: discord.Interaction):
         """Clears current list of sq times.  Staff use only."""
-        self.sq_times = []
+        for queue in self.queues_for(interaction):
+            queue.sq_times = []
+            self.save_settings(queue)
 
         await interaction.response.send_message("Cleared list of Squad Queue Times.")
 
@@ -580,16 +711,7 @@ class SquadQueue(commands.Cog):
     @commands.cooldown(1, 60, commands.BucketType.channel)
     async def staff(self, ctx):
         """Calls staff to the current channel. Only works in thread channels for SQ rooms."""
-        is_room_thread = False
-        for mogi in self.ongoing_events.values():
-            if mogi.is_room_thread(ctx.channel.id):
-                is_room_thread = True
-                break
-        for mogi in self.old_events.values():
-            if mogi.is_room_thread(ctx.channel.id):
-                is_room_thread = True
-                break
-        if not is_room_thread:
+        if ctx.channel.id not in self.room_threads:
             return
         if str(ctx.guild.id) not in ctx.bot.config["staff_roles"].keys():
             await ctx.send("There is no Lounge Staff role configured for this server")
@@ -599,80 +721,98 @@ class SquadQueue(commands.Cog):
             [ctx.guild.get_role(role).mention for role in lounge_staff_roles])
         await ctx.send(mentions)
 
-    async def end_voting(self):
-        """Ends voting in all rooms with ongoing votes."""
-        try:
-            index = 0
-            for mogi in self.ongoing_events.values():
-                index += 1
-                for room in mogi.rooms:
-                    if not room or not room.view:
-                        print(
-                            f"Skipping room {index} in function end_voting.", flush=True)
-                        continue
-                    await room.view.find_winner()
-        except Exception as e:
-            print(e, flush=True)
+    # every room runs through its own lifecycle: the vote is open until 6 votes
+    # pick a format or the room's deadline ends it, then the teams are made,
+    # the room's history entry is written and the room collects scores.
+    # rooms never wait on each other
 
-    async def write_history(self):
-        """Writes the teams, tier and average of each room per hour."""
+    def schedule_room_vote_end(self, mogi, room, votes_end_at):
+        self.deadlines.schedule((room, "votes"), datetime.fromtimestamp(votes_end_at, timezone.utc),
+                                partial(self.end_room_vote, room))
+
+    async def end_room_vote(self, room):
+        """Picks the format with the most votes once the room's vote runs out."""
+        if room.view is not None:
+            await room.view.find_winner()
+
+    def room_decided(self, mogi, room, view):
+        """Called by the room's VoteView as soon as its teams are made."""
+        self.deadlines.cancel((room, "votes"))
+        self.journal.vote(mogi, room, view)
+        self.write_room_history(mogi, room)
+
+    def write_room_history(self, mogi, room):
+        """Writes the teams, tier and average of the room."""
         try:
-            index = 0
-            for mogi in self.ongoing_events.values():
-                index += 1
-                await self.HISTORY_CHANNEL.send(f"{discord.utils.format_dt(mogi.start_time)} Rooms")
-                for room in mogi.rooms:
-                    if not room or not room.view:
-                        print(
-                            f"Skipping room {index} in function write_history.", flush=True)
-                        continue
-                    msg = room.view.header_text
-                    msg += f"{room.thread.jump_url}\n"
-                    msg += room.view.teams_text
-                    msg += "ㅤ"
-                    await self.HISTORY_CHANNEL.send(msg)
+            msg = room.view.header_text
+            msg += f"{room.thread.jump_url}\n"
+            msg += room.view.teams_text
+            msg += "ㅤ"
+            self.outbound.send(self.queue_of(mogi).HISTORY_CHANNEL, msg,
+                               priority=PRIORITY_HISTORY)
+            room.finished = True
+            self.journal.room_history(mogi, room)
         except Exception as e:
             print(e, flush=True)
 
+    def add_room(self, mogi, room):
+        mogi.add_room(room)
+        self.room_threads[room.thread.id] = (mogi, room)
+        self.journal.room(mogi, room)
+
+    def forget_mogis(self, mogis):
+        """Drops the room threads of deleted mogis from the thread registry
+        and deletes threads made ahead for them that were never used."""
+        for mogi in mogis:
+            self.journal.forget(mogi)
+            for kind in self.DEADLINE_KINDS:
+                self.deadlines.cancel((mogi, kind))
+            for room in mogi.rooms:
+                self.deadlines.cancel((room, "votes"))
+                self.room_threads.pop(room.thread.id, None)
+            asyncio.create_task(self.queue_of(mogi).provisioner.release(mogi))
+
     # make thread channels while the event is gathering instead of at the end,
     # since discord only allows 50 thread channels to be created per 5 minutes.
-    async def check_room_channels(self, mogi):
-        num_teams = mogi.count_registered()
-        num_rooms = int(num_teams / (12/mogi.size))
-        num_created_rooms = len(mogi.rooms)
-        if num_created_rooms >= num_rooms:
-            return
-        for i in range(num_created_rooms, num_rooms):
-            room_name = f"{mogi.start_time.month}/{mogi.start_time.day}, {mogi.start_time.hour}:00:00 - Room {i+1}"
-            try:
-                room_channel = await mogi.mogi_channel.create_thread(name=room_name,
-                                                                     auto_archive_duration=60,
-                                                                     invitable=False)
-            except Exception as e:
-                print(e, flush=True)
-                err_msg = f"\nAn error has occurred while creating a room channel:\n{e}"
-                await mogi.mogi_channel.send(err_msg)
-                return
-            mogi.rooms.append(Room(None, i+1, room_channel))
+    # the provisioner makes them in the background, so this never waits on discord
+    def check_room_channels(self, mogi):
+        self.queue_of(mogi).provisioner.request(mogi)
+
+    async def create_room_thread(self, mogi, room_num: int):
+        room_name = f"{mogi.start_time.month}/{mogi.start_time.day}, {mogi.start_time.hour}:00:00 - Room {room_num}"
+        return await mogi.mogi_channel.create_thread(name=room_name,
+                                                     auto_archive_duration=60,
+                                                     invitable=False)
+
+    def report_room_thread_error(self, mogi, e):
+        err_msg = f"\nAn error has occurred while creating a room channel:\n{e}"
+        self.outbound.send(mogi.mogi_channel, err_msg)
 
     # add teams to the room threads that we have already created
     async def add_teams_to_rooms(self, mogi, open_time: int, started_automatically=False):
+        queue = self.queue_of(mogi)
         if open_time >= 60 or open_time < 0:
-            await mogi.mogi_channel.send("Please specify a valid time (in minutes) for rooms to open (00-59)")
+            self.outbound.send(mogi.mogi_channel, "Please specify a valid time (in minutes) for rooms to open (00-59)")
             return
         if mogi.making_rooms_run and started_automatically:
             return
         num_rooms = int(mogi.count_registered() / (12/mogi.size))
         if num_rooms == 0:
-            await mogi.mogi_channel.send(f"Not enough players to fill a single room! This mogi will be cancelled.")
-            self.scheduled_events = {}
-            self.ongoing_events = {}
+            self.outbound.send(mogi.mogi_channel, f"Not enough players to fill a single room! This mogi will be cancelled.")
+            self.clear_scheduled_events(queue)
+            if queue.ongoing is not None:
+                self.forget_mogis([queue.ongoing])
+                queue.ongoing = None
+            self.plan_next_mogi(queue)
             return
-        await self.lockdown(mogi.mogi_channel)
+        # set before the first await, so overlapping deadlines can't make the rooms twice
         mogi.making_rooms_run = True
+        await queue.provisioner.ensure_rooms(mogi, num_rooms)
+        await self.lockdown(mogi.mogi_channel)
         if mogi.gathering:
             mogi.gathering = False
-            await mogi.mogi_channel.send("Mogi is now closed; players can no longer join or drop from the event")
+            self.save_mogi(mogi)
+            self.outbound.send(mogi.mogi_channel, "Mogi is now closed; players can no longer join or drop from the event")
 
         pen_time = open_time + 5
         start_time = open_time + 10
@@ -681,9 +821,8 @@ class SquadQueue(commands.Cog):
         while start_time >= 60:
             start_time -= 60
         teams_per_room = int(12/mogi.size)
-        num_teams = int(num_rooms * teams_per_room)
-        final_list = mogi.confirmed_list()[0:num_teams]
-        sorted_list = sorted(final_list, reverse=True)
+        room_teams, missed_teams = make_rooms(
+            mogi.confirmed_list(), teams_per_room, mogi.matchmaking_strategy)
 
         extra_members = []
         if str(mogi.mogi_channel.guild.id) in self.bot.config["members_for_channels"].keys():
@@ -692,17 +831,25 @@ class SquadQueue(commands.Cog):
             for m in extra_members_ids:
                 extra_members.append(mogi.mogi_channel.guild.get_member(m))
 
-        rooms = mogi.rooms
+        # the rooms' history entries follow as each room's vote ends
+        self.outbound.send(queue.HISTORY_CHANNEL, f"{discord.utils.format_dt(mogi.start_time)} Rooms",
+                           priority=PRIORITY_HISTORY)
+        votes_end_at = time.time() + 120
+        self.save_mogi(mogi, votes_end_at=votes_end_at)
+
+        room_msgs = []
+        room_mentions = []
+        announcements = []
+        # every room thread is announced independently, at most ROOM_FANOUT at a time
+        semaphore = asyncio.Semaphore(queue.ROOM_FANOUT)
         for i in range(num_rooms):
             msg = f"`Room {i+1} - Player List`\n"
             mentions = ""
-            start_index = int(i*teams_per_room)
             player_list = []
             for j in range(teams_per_room):
                 msg += f"`{j+1}.` "
-                team = sorted_list[start_index+j]
-                player_list.append(
-                    sorted_list[start_index+j].get_first_player())
+                team = room_teams[i][j]
+                player_list.append(team.get_first_player())
                 msg += ", ".join([p.lounge_name for p in team.players])
                 msg += f" ({int(team.avg_mmr)} MMR)\n"
                 mentions += " ".join([p.member.mention for p in team.players])
@@ -710,196 +857,357 @@ class SquadQueue(commands.Cog):
             avg_mmr = round(sum([p.mmr for p in player_list]) / 12)
             room_msg = msg
             mentions += " ".join([m.mention for m in extra_members if m is not None])
-            if avg_mmr > self.SIX_VS_SIX_THRESHOLD:
+            if avg_mmr > queue.SIX_VS_SIX_THRESHOLD:
                 room_msg += "\nVote for format FFA, 2v2, 3v3, 4v4 or 6v6.\n"
             else:
                 room_msg += "\nVote for format FFA, 2v2, 3v3, 4v4.\n"
             room_msg += "\nIf you need staff's assistance, use the `!staff` command in this channel.\n"
             room_msg += mentions
-            try:
-                curr_room = rooms[i]
-                room_channel = curr_room.thread
-                curr_room.teams = sorted_list[start_index:start_index+teams_per_room]
-                await room_channel.send(room_msg)
-                view = VoteView(player_list, room_channel,
-                                mogi, self.SIX_VS_SIX_THRESHOLD)
-                curr_room.view = view
-                curr_room.mmr_low = player_list[11].mmr
-                curr_room.mmr_high = player_list[0].mmr
-                await room_channel.send(view=view)
-            except Exception as e:
-                print(e, flush=True)
+            room_msgs.append(msg)
+            room_mentions.append(mentions)
+            announcements.append(self.announce_room(
+                mogi, i, room_teams[i], player_list, room_msg, semaphore, votes_end_at))
+        results = await asyncio.gather(*announcements)
+        await queue.provisioner.release(mogi)
+
+        # the join channel summary is queued in one go so the scheduler
+        # can combine the rooms into as few messages as possible
+        for msg, mentions, announced in zip(room_msgs, room_mentions, results):
+            if not announced:
                 err_msg = f"\nAn error has occurred while creating the room channel; please contact your opponents in DM or another channel\n"
                 err_msg += mentions
                 msg += err_msg
-                room_channel = None
-            try:
-                await mogi.mogi_channel.send(msg)
-            except Exception as e:
-                print(
-                    f"Mogi Channel message for room {i+1} has failed to send.", flush=True)
-                print(e, flush=True)
-        if num_teams < mogi.count_registered():
-            missed_teams = mogi.confirmed_list(
-            )[num_teams:mogi.count_registered()]
+            self.outbound.send(mogi.mogi_channel, msg,
+                               priority=PRIORITY_ROOM, coalesce=True)
+        if missed_teams:
             msg = "`Late players:`\n"
             for i in range(len(missed_teams)):
                 msg += f"`{i+1}.` "
                 msg += ", ".join([p.lounge_name for p in missed_teams[i].players])
                 msg += f" ({int(missed_teams[i].avg_mmr)} MMR)\n"
+            self.outbound.send(mogi.mogi_channel, msg,
+                               priority=PRIORITY_ROOM, coalesce=True)
+
+    async def announce_room(self, mogi, room_index, teams, player_list, room_msg, semaphore, votes_end_at):
+        """Posts the player list and the vote to a room thread.  Returns False if that failed."""
+        async with semaphore:
             try:
-                await mogi.mogi_channel.send(msg)
+                curr_room = mogi.rooms[room_index]
+                room_channel = curr_room.thread
+                curr_room.set_teams(teams)
+                await self.outbound.send(room_channel, room_msg, priority=PRIORITY_ROOM)
+                view = self.make_vote_view(mogi, room_channel, player_list)
+                curr_room.view = view
+                curr_room.mmr_low = player_list[11].mmr
+                curr_room.mmr_high = player_list[0].mmr
+                self.journal.room_teams(mogi, curr_room, player_list)
+                self.schedule_room_vote_end(mogi, curr_room, votes_end_at)
+                view.message = await self.outbound.send(room_channel, view=view, priority=PRIORITY_ROOM)
+                return True
             except Exception as e:
-                print("Late Player message has failed to send.", flush=True)
                 print(e, flush=True)
-        await asyncio.sleep(120)
-        await self.end_voting()
-        await self.write_history()
-
-    async def check_num_teams(self, mogi):
+                return False
+
+    def make_vote_view(self, mogi, thread, player_list):
+        queue = self.queue_of(mogi)
+        return VoteView(player_list, thread, mogi, queue.SIX_VS_SIX_THRESHOLD,
+                        queue.TEAM_SPLIT_BUDGET_MS / 1000, on_decided=self.room_decided,
+                        on_vote=self.record_vote if self.recorder is not None else None,
+                        formats=queue.FORMATS)
+
+    def check_num_teams(self, mogi):
+        """Closes the mogi once it is past joining time with only full rooms.
+        Returns True if it was closed; call with mogi.lock held."""
         if not mogi.gathering or not mogi.is_automated:
-            return
+            return False
+        queue = self.queue_of(mogi)
         cur_time = datetime.now(timezone.utc)
-        if mogi.start_time - self.QUEUE_OPEN_TIME + self.JOINING_TIME <= cur_time:
+        if mogi.start_time - queue.QUEUE_OPEN_TIME + queue.JOINING_TIME <= cur_time:
             numLeftoverTeams = mogi.count_registered() % int((12/mogi.size))
             if numLeftoverTeams == 0:
                 mogi.gathering = False
-                await self.lockdown(mogi.mogi_channel)
-                await mogi.mogi_channel.send("A sufficient amount of players has been reached, so the mogi has been closed to extra players. Rooms will be made within the next minute.")
+                return True
+        return False
+
+    async def announce_enough_teams(self, mogi):
+        self.deadlines.schedule((mogi, "check"), datetime.now(timezone.utc),
+                                partial(self.ongoing_mogi_checks, mogi))
+        await self.lockdown(mogi.mogi_channel)
+        self.outbound.send(mogi.mogi_channel, "A sufficient amount of players has been reached, so the mogi has been closed to extra players. Rooms will be made within the next minute.")
 
-    async def ongoing_mogi_checks(self):
-        for mogi in self.ongoing_events.values():
+    # deadlines registered per mogi, keyed (mogi, kind)
+    DEADLINE_KINDS = ("open", "check", "force", "expire")
+
+    def schedule_mogi_deadlines(self, mogi):
+        """Registers the deadlines of the stage the mogi is in."""
+        if not mogi.is_automated or mogi.start_time is None:
+            return
+        queue = self.queue_of(mogi)
+        open_time = mogi.start_time - queue.QUEUE_OPEN_TIME
+        if not mogi.started:
+            self.deadlines.schedule((mogi, "open"), open_time, partial(self.scheduler_mogi_start, queue))
+        elif not mogi.making_rooms_run:
+            joining_end = open_time + queue.JOINING_TIME
+            check = partial(self.ongoing_mogi_checks, mogi)
+            self.deadlines.schedule((mogi, "check"), joining_end, check)
+            self.deadlines.schedule((mogi, "force"), joining_end + queue.EXTENSION_TIME, check)
+
+    def schedule_expiry(self, mogi):
+        queue = self.queue_of(mogi)
+        self.deadlines.schedule((mogi, "expire"), mogi.start_time + timedelta(minutes=queue.MOGI_LIFETIME),
+                                partial(self.delete_old_mogi, mogi))
+
+    async def ongoing_mogi_checks(self, mogi):
+        """Runs when joining time ends, once a minute during the extension and
+        when the extension ends; closes the mogi and makes the rooms once it's time."""
+        queue = self.queue_of(mogi)
+        async with metrics.timed_lock(mogi.lock, "checks"):
             # If it's not automated, not started, we've already started making the rooms, don't run this
-            async with self.LOCK:
-                if not mogi.is_automated or not mogi.started or mogi.making_rooms_run:
-                    return
-                cur_time = datetime.now(timezone.utc)
-                if (mogi.start_time - self.QUEUE_OPEN_TIME + self.JOINING_TIME + self.EXTENSION_TIME) <= cur_time:
+            if not mogi.is_automated or not mogi.started or mogi.making_rooms_run:
+                return
+            cur_time = datetime.now(timezone.utc)
+            joining_end = mogi.start_time - queue.QUEUE_OPEN_TIME + queue.JOINING_TIME
+            force_time = joining_end + queue.EXTENSION_TIME
+            if force_time <= cur_time:
+                mogi.gathering = False
+            if joining_end <= cur_time and mogi.gathering:
+                # check if there are an even amount of teams since we are past the queue time
+                numLeftoverTeams = mogi.count_registered() % int((12/mogi.size))
+                if numLeftoverTeams == 0:
                     mogi.gathering = False
-                if mogi.start_time - self.QUEUE_OPEN_TIME + self.JOINING_TIME <= cur_time and mogi.gathering:
-                    # check if there are an even amount of teams since we are past the queue time
-                    numLeftoverTeams = mogi.count_registered() % int((12/mogi.size))
-                    if numLeftoverTeams == 0:
-                        mogi.gathering = False
-                    else:
-                        if int(cur_time.second / 20) == 0:
-                            force_time = mogi.start_time - self.QUEUE_OPEN_TIME + \
-                                self.JOINING_TIME + self.EXTENSION_TIME
-                            minutes_left = int(
-                                (force_time - cur_time).seconds/60)
-                            x_teams = int(int(12/mogi.size) - numLeftoverTeams)
-                            await mogi.mogi_channel.send(f"Need {x_teams} more player(s) to start immediately. Starting in {minutes_left + 1} minute(s) regardless.")
-            if not mogi.gathering:
-                await self.delete_list_messages(0)
-                await mogi.mogi_channel.send("Mogi is now closed; players can no longer join or drop from the event")
-                await self.add_teams_to_rooms(mogi, (mogi.start_time.minute) % 60, True)
-
-    async def scheduler_mogi_start(self):
+                else:
+                    minutes_left = math.ceil((force_time - cur_time).total_seconds() / 60)
+                    x_teams = int(int(12/mogi.size) - numLeftoverTeams)
+                    self.outbound.send(mogi.mogi_channel, f"Need {x_teams} more player(s) to start immediately. Starting in {minutes_left} minute(s) regardless.")
+                    next_check = cur_time + timedelta(minutes=1)
+                    if next_check < force_time:
+                        self.deadlines.schedule((mogi, "check"), next_check,
+                                                partial(self.ongoing_mogi_checks, mogi))
+        if not mogi.gathering:
+            self.deadlines.cancel((mogi, "check"))
+            self.deadlines.cancel((mogi, "force"))
+            self.save_mogi(mogi)
+            asyncio.create_task(self.delete_list_messages(queue, 0))
+            self.outbound.send(mogi.mogi_channel, "Mogi is now closed; players can no longer join or drop from the event")
+            await self.add_teams_to_rooms(mogi, (mogi.start_time.minute) % 60, True)
+
+    async def scheduler_mogi_start(self, queue):
         cur_time = datetime.now(timezone.utc)
-        for guild in self.scheduled_events.values():
-            to_remove = []  # Keep a list of indexes to remove - can't remove while iterating
-            for i, mogi in enumerate(guild):
-                if (mogi.start_time - self.QUEUE_OPEN_TIME) < cur_time:
-                    if mogi.mogi_channel in self.ongoing_events.keys() and self.ongoing_events[mogi.mogi_channel].gathering:
-                        to_remove.append(i)
-                        await mogi.mogi_channel.send(f"Because there is an ongoing event right now, the following event has been removed:\n{self.get_event_str(mogi)}\n")
-                    else:
-                        if mogi.mogi_channel in self.ongoing_events.keys():
-                            if self.ongoing_events[mogi.mogi_channel].started:
-                                # very bad but should be fine so long as the time between mogis is 1 hour
-                                key = mogi.start_time - timedelta(hours=1)
-                                self.old_events[key.hour] = self.ongoing_events[mogi.mogi_channel]
-                                del self.ongoing_events[mogi.mogi_channel]
-                        to_remove.append(i)
-                        mogi.started = True
-                        mogi.gathering = True
-                        self.ongoing_events[mogi.mogi_channel] = mogi
-                        await self.unlockdown(mogi.mogi_channel)
-                        await mogi.mogi_channel.send(f"A queue is gathering for the mogi {discord.utils.format_dt(mogi.start_time, style='R')} - Type `/c` to join, and `/d` to drop.")
-            for ind in reversed(to_remove):
-                del guild[ind]
-
-    @tasks.loop(seconds=20.0)
-    async def sqscheduler(self):
-        """Scheduler that checks if it should start mogis and close them"""
-        # It may seem silly to do try/except Exception, but this coroutine **cannot** fail
-        # This coroutine *silently* fails and stops if exceptions aren't caught - an annoying abtraction of asyncio
-        # This is unacceptable considering people are relying on these mogis to run, so we will not allow this routine to stop
-        try:
-            await self.scheduler_mogi_start()
-        except Exception as e:
-            print(e)
-        try:
-            await self.ongoing_mogi_checks()
-        except Exception as e:
-            print(e)
-
-    @tasks.loop(minutes=1)
-    async def que_scheduler(self):
-        try:
-            if not self.scheduled_events or len(self.scheduled_events[self.GUILD]) == 0:
-                await self.schedule_que_event()
-        except Exception as e:
-            print(e)
+        to_remove = []  # Keep a list of indexes to remove - can't remove while iterating
+        for i, mogi in enumerate(queue.scheduled):
+            if (mogi.start_time - queue.QUEUE_OPEN_TIME) < cur_time:
+                if queue.ongoing is not None and queue.ongoing.gathering:
+                    to_remove.append(i)
+                    self.journal.forget(mogi)
+                    self.outbound.send(mogi.mogi_channel, f"Because there is an ongoing event right now, the following event has been removed:\n{self.get_event_str(mogi)}\n")
+                else:
+                    if queue.ongoing is not None and queue.ongoing.started:
+                        old_mogi = queue.ongoing
+                        if old_mogi.start_time in queue.old:
+                            self.forget_mogis([queue.old[old_mogi.start_time]])
+                        queue.old[old_mogi.start_time] = old_mogi
+                        queue.ongoing = None
+                        self.journal.mogi(old_mogi, "old")
+                        self.schedule_expiry(old_mogi)
+                    to_remove.append(i)
+                    mogi.started = True
+                    mogi.gathering = True
+                    queue.ongoing = mogi
+                    self.journal.mogi(mogi, "ongoing")
+                    self.schedule_mogi_deadlines(mogi)
+                    self.request_list_update(queue)
+                    await self.unlockdown(mogi.mogi_channel)
+                    self.outbound.send(mogi.mogi_channel, f"A queue is gathering for the mogi {discord.utils.format_dt(mogi.start_time, style='R')} - Type `/c` to join, and `/d` to drop.")
+        for ind in reversed(to_remove):
+            del queue.scheduled[ind]
+        self.plan_next_mogi(queue)
+
+    def plan_next_mogi(self, queue, retry=False):
+        """Schedules the next attempt to put a mogi on the queue's schedule:
+        right away, or once the next hour starts if the last attempt couldn't,
+        and never before QUEUE_TIME_BLOCKER."""
+        when = datetime.now(timezone.utc)
+        if retry:
+            when = when.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        self.deadlines.schedule(("schedule", queue.name), max(when, queue.QUEUE_TIME_BLOCKER),
+                                partial(self.que_scheduler, queue))
+
+    async def que_scheduler(self, queue):
+        if not queue.scheduled:
+            await self.schedule_que_event(queue)
+        if not queue.scheduled:
+            self.plan_next_mogi(queue, retry=True)
 
     @tasks.loop(minutes=10)
     async def lounge_mmr(self):
         try:
-            await lounge_data.lounge_api_full()
+            await lounge_data.lounge_api_full(self.lounge_client)
         except Exception as e:
             print(e)
 
-    async def schedule_que_event(self):
-        """Schedules queue for the next hour in the given channel."""
+    async def schedule_que_event(self, queue):
+        """Schedules the queue's mogi for the next hour."""
 
-        if self.GUILD is not None:
+        if queue.GUILD is not None:
             curr_time = datetime.now(timezone.utc)
             truncated_time = curr_time.replace(
                 minute=0, second=0, microsecond=0)
             next_hour = truncated_time + timedelta(hours=1)
-            if len(self.sq_times) > 0 and next_hour == self.sq_times[0]:
-                self.sq_times.pop(0)
-                self.QUEUE_TIME_BLOCKER = next_hour
-                await self.MOGI_CHANNEL.send("Squad Queue is currently going on at this hour!  The queue will remain closed.")
-            if curr_time < self.QUEUE_TIME_BLOCKER:
-                # print(f"Mogi had been blocked from starting before the time limit {self.QUEUE_TIME_BLOCKER}", flush=True)
+            if len(queue.sq_times) > 0 and next_hour == queue.sq_times[0]:
+                queue.sq_times.pop(0)
+                queue.QUEUE_TIME_BLOCKER = next_hour
+                self.save_settings(queue)
+                self.outbound.send(queue.MOGI_CHANNEL, "Squad Queue is currently going on at this hour!  The queue will remain closed.")
+            if curr_time < queue.QUEUE_TIME_BLOCKER:
+                # print(f"Mogi had been blocked from starting before the time limit {queue.QUEUE_TIME_BLOCKER}", flush=True)
                 return
-            if datetime.now().minute >= self.bot.config["JOINING_TIME"]:
+            if datetime.now().minute >= queue.JOINING_TIME.total_seconds() / 60:
                 # print("Hourly Que is too late, starting Que at next hour", flush=True)
                 return
-            for mogi in self.ongoing_events.values():
-                if mogi.start_time == next_hour:
-                    return
-            event_start_time = next_hour.astimezone() - self.QUEUE_OPEN_TIME
-            if event_start_time < discord.utils.utcnow():
-                event_start_time = discord.utils.utcnow() + timedelta(minutes=1)
+            if queue.ongoing is not None and queue.ongoing.start_time == next_hour:
+                return
 
-            mogi = Mogi(1, 1, self.MOGI_CHANNEL, is_automated=True,
-                        start_time=next_hour)
+            mogi = Mogi(1, 1, queue.MOGI_CHANNEL, is_automated=True,
+                        start_time=next_hour,
+                        matchmaking_strategy=queue.MATCHMAKING_STRATEGY)
 
-            if self.GUILD not in self.scheduled_events.keys():
-                self.scheduled_events[self.GUILD] = []
+            queue.scheduled.append(mogi)
+            self.journal.mogi(mogi, "scheduled")
+            self.schedule_mogi_deadlines(mogi)
 
-            self.scheduled_events[self.GUILD].append(mogi)
+            print(f"Started Queue {queue.name} for {next_hour}", flush=True)
 
-            print(f"Started Queue for {next_hour}", flush=True)
+    async def delete_old_mogi(self, mogi):
+        """Deletes an old mogi object once its lifetime is over"""
+        queue = self.queue_of(mogi)
+        if queue.old.get(mogi.start_time) is not mogi:
+            return
+        print(
+            f"Deleting {mogi.start_time} Mogi of queue {queue.name} at {datetime.now(timezone.utc)}", flush=True)
+        del queue.old[mogi.start_time]
+        self.forget_mogis([mogi])
+
+    def save_mogi(self, mogi, **extra):
+        queue = self.queue_of(mogi)
+        if queue.ongoing is mogi:
+            where = "ongoing"
+        elif queue.old.get(mogi.start_time) is mogi:
+            where = "old"
+        else:
+            where = "scheduled"
+        self.journal.mogi(mogi, where, **extra)
+
+    def save_settings(self, queue):
+        self.journal.settings(queue.name, queue.QUEUE_TIME_BLOCKER, queue.sq_times)
+
+    def clear_scheduled_events(self, queue):
+        for mogi in queue.scheduled:
+            self.journal.forget(mogi)
+            self.deadlines.cancel((mogi, "open"))
+        queue.scheduled = []
+
+    async def restore_state(self, state):
+        """Rebuilds the mogis, teams and rooms recorded in the journal."""
+        start = time.perf_counter()
+        for name, settings in state["settings"].items():
+            queue = self.queues.get(name)
+            if queue is None:
+                continue
+            if settings["queue_time_blocker"]:
+                queue.QUEUE_TIME_BLOCKER = parse_time(settings["queue_time_blocker"])
+            queue.sq_times = [parse_time(date) for date in settings["sq_times"]]
+        restored = 0
+        for key, saved in list(state["mogis"].items()):
+            try:
+                mogi = await self.restore_mogi(saved)
+            except Exception as e:
+                print(f"Restoring mogi {key} failed: {e}", flush=True)
+                mogi = None
+            if mogi is None:
+                self.journal.record("forget", mogi=key)
+                continue
+            restored += 1
+            queue = self.queue_of(mogi)
+            if saved["where"] == "ongoing":
+                queue.ongoing = mogi
+            elif saved["where"] == "old":
+                queue.old[mogi.start_time] = mogi
+                self.schedule_expiry(mogi)
+            else:
+                queue.scheduled.append(mogi)
+            self.schedule_mogi_deadlines(mogi)
+        for queue in self.queues.values():
+            self.request_list_update(queue)
+        print(f"Restored {restored} mogi(s) from the journal in {time.perf_counter() - start:.3f}s", flush=True)
+
+    async def restore_mogi(self, saved):
+        channel = self.bot.get_channel(saved["channel_id"])
+        if channel is None or channel.id not in self.queues_by_channel:
+            return None
+        guild = channel.guild
+        mogi = Mogi(saved["sq_id"], saved["size"], channel,
+                    is_automated=saved["is_automated"],
+                    start_time=parse_time(saved["start_time"]),
+                    matchmaking_strategy=saved["matchmaking_strategy"])
+        mogi.started = saved["started"]
+        mogi.gathering = saved["gathering"]
+        mogi.making_rooms_run = saved["making_rooms_run"]
+
+        players = {}
+        for saved_team in saved["teams"]:
+            try:
+                team_players = []
+                for member_id, name, mmr, confirmed in saved_team:
+                    member = guild.get_member(member_id) or await guild.fetch_member(member_id)
+                    player = Player(member, name, mmr)
+                    player.confirmed = confirmed
+                    team_players.append(player)
+            except Exception as e:
+                print(f"Restoring team {saved_team} failed: {e}", flush=True)
+                continue
+            for player in team_players:
+                players[player.member.id] = player
+            mogi.add_team(Team(team_players))
 
-    @tasks.loop(minutes=1)
-    async def delete_old_mogis(self):
-        """Deletes old mogi objects"""
-        try:
-            curr_time = datetime.now(timezone.utc)
-            mogi_lifetime = timedelta(minutes=self.MOGI_LIFETIME)
-            delete_queue = []
-            for mogi in self.old_events.values():
-                if curr_time - mogi_lifetime > mogi.start_time:
-                    delete_queue.append(mogi)
-            for mogi in delete_queue:
-                print(
-                    f"Deleting {mogi.start_time} Mogi at {curr_time}", flush=True)
-                del self.old_events[mogi.start_time.hour]
-        except Exception as e:
-            print(e, flush=True)
+        for thread_id, saved_room in saved["rooms"].items():
+            try:
+                thread = guild.get_thread(int(thread_id)) or await guild.fetch_channel(int(thread_id))
+                room = Room(None, saved_room["room_num"], thread)
+                room.mmr_low = saved_room["mmr_low"]
+                room.mmr_high = saved_room["mmr_high"]
+                room.mmr_average = saved_room["mmr_average"]
+                if saved_room["teams"] is not None:
+                    room.set_teams([Team([players[member_id] for member_id in team])
+                                    for team in saved_room["teams"]])
+                    for member_id, score in saved_room["scores"].items():
+                        room.players[int(member_id)].score = score
+                    player_list = [players[member_id] for member_id in saved_room["players"]]
+                    room.view = self.make_vote_view(mogi, thread, player_list)
+                    if saved_room["header_text"] is not None:
+                        room.view.found_winner = True
+                        room.view.header_text = saved_room["header_text"]
+                        room.view.teams_text = saved_room["teams_text"]
+                        for button in room.view.children:
+                            button.disabled = True
+                        room.finished = saved_room.get("history_written", False)
+                        if not room.finished:
+                            self.write_room_history(mogi, room)
+                    else:
+                        future = self.outbound.send(thread, "The bot restarted during the vote, so the vote has been reset.",
+                                                    view=room.view, priority=PRIORITY_ROOM)
+
+                        # the view edits this message when the vote ends, clicked or not
+                        def set_message(future, view=room.view):
+                            if not future.cancelled() and future.exception() is None:
+                                view.message = future.result()
+                        future.add_done_callback(set_message)
+                        self.schedule_room_vote_end(mogi, room, saved.get("votes_end_at", time.time() + 120))
+            except Exception as e:
+                print(f"Restoring room thread {thread_id} failed: {e}", flush=True)
+                continue
+            mogi.add_room(room)
+            self.room_threads[thread.id] = (mogi, room)
+        return mogi
 
     def get_event_str(self, mogi):
         mogi_time = discord.utils.format_dt(mogi.start_time, style="F")
@@ -916,7 +1224,8 @@ class SquadQueue(commands.Cog):
     @commands.command(name="sync_server")
     @commands.is_owner()
     async def sync_server(self, ctx):
-        await self.bot.tree.sync(guild=discord.Object(id=self.bot.config["guild_id"]))
+        for guild_id in {queue.guild_id for queue in self.queues.values()}:
+            await self.bot.tree.sync(guild=discord.Object(id=guild_id))
         await ctx.send("sync'd")
 
     @commands.command(name="debug_add_team")
@@ -931,17 +1240,23 @@ class SquadQueue(commands.Cog):
 
         check_players = [ctx.author]
         check_players.extend(members)
-        players = await mk8dx_150cc_mmr(self.URL, check_players)
+        players = await self.lounge_client.mk8dx_150cc_mmr(check_players)
+        if players[0] is None:
+            await self.queue_or_send(ctx, f"MMR lookup for {ctx.author} has failed.")
+            return
         for i in range(0, 12):
             player = Player(
                 players[0].member, f"{players[0].lounge_name}{i + 1}", players[0].mmr + (10 * i))
             player.confirmed = True
             squad = Team([player])
-            mogi.teams.append(squad)
+            mogi.add_team(squad)
+            self.journal.join(mogi, squad)
         msg = f"{players[0].lounge_name} added 12 times."
         await self.queue_or_send(ctx, msg)
-        await self.check_room_channels(mogi)
-        await self.check_num_teams(mogi)
+        self.request_list_update(self.queue_of(mogi))
+        self.check_room_channels(mogi)
+        if self.check_num_teams(mogi):
+            await self.announce_enough_teams(mogi)
 
     @commands.command(name="debug_add_many_players")
     @commands.is_owner()
@@ -955,17 +1270,23 @@ class SquadQueue(commands.Cog):
 
         check_players = [ctx.author]
         check_players.extend(members)
-        players = await mk8dx_150cc_mmr(self.URL, check_players)
+        players = await self.lounge_client.mk8dx_150cc_mmr(check_players)
+        if players[0] is None:
+            await self.queue_or_send(ctx, f"MMR lookup for {ctx.author} has failed.")
+            return
         for i in range(0, 100):
             player = Player(
                 players[0].member, f"{players[0].lounge_name}{i + 1}", players[0].mmr + (10 * i))
             player.confirmed = True
             squad = Team([player])
-            mogi.teams.append(squad)
+            mogi.add_team(squad)
+            self.journal.join(mogi, squad)
         msg = f"{players[0].lounge_name} added 100 times."
         await self.queue_or_send(ctx, msg)
-        await self.check_room_channels(mogi)
-        await self.check_num_teams(mogi)
+        self.request_list_update(self.queue_of(mogi))
+        self.check_room_channels(mogi)
+        if self.check_num_teams(mogi):
+            await self.announce_enough_teams(mogi)
 
     @commands.command(name="debug_start_rooms")
     @commands.is_owner()
@@ -973,12 +1294,11 @@ class SquadQueue(commands.Cog):
         truncated_time = datetime.now(timezone.utc).replace(
             minute=0, second=0, microsecond=0)
         next_hour = truncated_time + timedelta(hours=1)
-        for mogi in self.ongoing_events.values():
-            if mogi.start_time == next_hour:
-                await self.add_teams_to_rooms(mogi, (mogi.start_time.minute) % 60, True)
-                return
-        for mogi in self.old_events.values():
-            if mogi.start_time == next_hour:
+        queue = self.get_queue(ctx)
+        if queue is None:
+            return
+        for mogi in queue.mogis():
+            if mogi.started and mogi.start_time == next_hour:
                 await self.add_teams_to_rooms(mogi, (mogi.start_time.minute) % 60, True)
                 return
 
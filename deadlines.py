@@ -0,0 +1,91 @@
+import asyncio
+import heapq
+import itertools
+from datetime import datetime, timezone
+
+
+class DeadlineScheduler:
+    """Runs callbacks at exact times instead of polling for them.
+
+    Deadlines live in a heap ordered by time, and a single task sleeps until
+    the earliest one is due, so nothing runs while nothing is due. Every
+    deadline has a key; scheduling a key again moves it and cancel(key)
+    drops it. Callbacks are coroutine functions, each run in its own task
+    so a slow one doesn't hold up the others."""
+
+    # sleep in slices of at most this many seconds, in case the clock jumps
+    MAX_SLEEP = 600
+
+    # real seconds slept per second of schedule time; a replay runs faster than real time
+    time_scale = 1.0
+
+    def __init__(self):
+        self._heap = []
+        # key -> the live heap entry; entries that were moved or cancelled stay
+        # in the heap until they come up and are skipped
+        self._entries = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        # on_run(key) is called as each deadline comes up, e.g. by the recorder
+        self.on_run = None
+
+    def now(self):
+        return datetime.now(timezone.utc)
+
+    def schedule(self, key, when: datetime, callback):
+        entry = [when, next(self._seq), key, callback]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def cancel(self, key):
+        self._entries.pop(key, None)
+
+    def when(self, key):
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._heap = []
+        self._entries = {}
+
+    def _pop_stale(self):
+        while self._heap and self._entries.get(self._heap[0][2]) is not self._heap[0]:
+            heapq.heappop(self._heap)
+
+    async def _run(self):
+        while True:
+            self._pop_stale()
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            delay = (self._heap[0][0] - self.now()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), min(delay * self.time_scale, self.MAX_SLEEP))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            when, _, key, callback = heapq.heappop(self._heap)
+            del self._entries[key]
+            if self.on_run is not None:
+                self.on_run(key)
+            asyncio.create_task(self._call(key, callback))
+
+    async def _call(self, key, callback):
+        # a failing callback must never take the scheduler down with it
+        try:
+            await callback()
+        except Exception as e:
+            print(f"Deadline {key} failed: {e}", flush=True)
@@ -0,0 +1,250 @@
+import json
+import os
+from datetime import datetime
+
+
+def mogi_key(mogi):
+    start_time = mogi.start_time.isoformat() if mogi.start_time else None
+    return f"{mogi.mogi_channel.id}/{start_time}"
+
+
+def _team_state(team):
+    return [[p.member.id, p.lounge_name, p.mmr, p.confirmed] for p in team.players]
+
+
+def _empty_state():
+    return {"settings": {}, "mogis": {}, "messages": {}}
+
+
+def apply(state, entry):
+    """Applies one journal entry to the plain dict state."""
+    op = entry["op"]
+    if op == "settings":
+        state["settings"][entry["queue"]] = {
+            "queue_time_blocker": entry["queue_time_blocker"], "sq_times": entry["sq_times"]}
+        return
+    if op == "own":
+        state["messages"][str(entry["message_id"])] = [entry["channel_id"], entry["expires_at"]]
+        return
+    if op == "disown":
+        for message_id in entry["message_ids"]:
+            state["messages"].pop(str(message_id), None)
+        return
+    mogis = state["mogis"]
+    key = entry["mogi"]
+    if op == "mogi":
+        mogi = mogis.setdefault(key, {"teams": [], "rooms": {}})
+        mogi.update(entry["fields"])
+        return
+    if op == "forget":
+        mogis.pop(key, None)
+        return
+    mogi = mogis.get(key)
+    if mogi is None:
+        return
+    if op == "join":
+        mogi["teams"].append(entry["team"])
+    elif op == "drop":
+        member_id = entry["member_id"]
+        mogi["teams"] = [team for team in mogi["teams"]
+                         if all([p[0] != member_id for p in team])]
+    elif op == "room":
+        mogi["rooms"][str(entry["thread_id"])] = {
+            "room_num": entry["room_num"], "teams": None, "players": None,
+            "mmr_low": None, "mmr_high": None, "mmr_average": 0,
+            "header_text": None, "teams_text": "", "scores": {},
+            "history_written": False}
+    else:
+        room = mogi["rooms"].get(str(entry["thread_id"]))
+        if room is None:
+            return
+        if op == "room_teams":
+            for field in ("teams", "players", "mmr_low", "mmr_high"):
+                room[field] = entry[field]
+        elif op == "vote":
+            for field in ("teams", "mmr_average", "header_text", "teams_text"):
+                room[field] = entry[field]
+        elif op == "room_history":
+            room["history_written"] = True
+        elif op == "score":
+            room["scores"][str(entry["member_id"])] = entry["score"]
+
+
+class Journal:
+    """Append-only record of every queue state change, for crash recovery.
+
+    Each change is applied to a plain dict model of the state and appended to
+    the current journal segment as one JSON line.  Every `snapshot_every`
+    entries the model is written out as a snapshot and a new segment is
+    started, so recovery only replays the entries since the last snapshot.
+    Lines are flushed as they are written, which survives the process dying
+    but not the machine losing power."""
+
+    SNAPSHOT = "snapshot.json"
+
+    def __init__(self, directory, snapshot_every=1000):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.state = _empty_state()
+        self.seq = 0
+        self._since_snapshot = 0
+        self._file = None
+        # False until something was recovered from disk
+        self.restored = False
+
+    def recover(self):
+        """Loads the latest snapshot and replays the journal after it.
+        Returns the recovered state."""
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            with open(os.path.join(self.directory, self.SNAPSHOT), "r") as f:
+                snapshot = json.load(f)
+            self.state = snapshot["state"]
+            self.seq = snapshot["seq"]
+            self.restored = True
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Loading journal snapshot failed: {e}", flush=True)
+        for name in self._segments():
+            with open(os.path.join(self.directory, name), "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # torn last line of a crash
+                        break
+                    if entry["seq"] <= self.seq:
+                        continue
+                    apply(self.state, entry)
+                    self.seq = entry["seq"]
+                    self.restored = True
+        for key, value in _empty_state().items():
+            self.state.setdefault(key, value)
+        # compacts what was replayed and opens a fresh segment
+        self.snapshot()
+        return self.state
+
+    def record(self, op, **fields):
+        self.seq += 1
+        entry = {"seq": self.seq, "op": op, **fields}
+        apply(self.state, entry)
+        if self._file is None:
+            return
+        try:
+            self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            self._file.flush()
+        except Exception as e:
+            print(f"Writing to the journal failed: {e}", flush=True)
+        self._since_snapshot += 1
+        if self._since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def snapshot(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, self.SNAPSHOT)
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"seq": self.seq, "state": self.state}, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Saving journal snapshot failed: {e}", flush=True)
+            return
+        old_segments = self._segments()
+        if self._file is not None:
+            self._file.close()
+        self._file = open(os.path.join(self.directory, f"journal-{self.seq + 1:012d}.jsonl"), "a")
+        self._since_snapshot = 0
+        # everything in the older segments is covered by the snapshot now
+        for name in old_segments:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError as e:
+                print(e, flush=True)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _segments(self):
+        return sorted([name for name in os.listdir(self.directory)
+                       if name.startswith("journal-") and name.endswith(".jsonl")])
+
+    # one method per kind of change, so callers don't build entries by hand
+
+    def settings(self, queue_name, queue_time_blocker, sq_times):
+        self.record("settings", queue=queue_name, queue_time_blocker=queue_time_blocker.isoformat(),
+                    sq_times=[date.isoformat() for date in sq_times])
+
+    def mogi(self, mogi, where, **extra):
+        """Records a new mogi or a change to its flags; where is
+        "scheduled", "ongoing" or "old"."""
+        fields = {
+            "where": where,
+            "guild_id": mogi.mogi_channel.guild.id,
+            "channel_id": mogi.mogi_channel.id,
+            "sq_id": mogi.sq_id,
+            "size": mogi.size,
+            "is_automated": mogi.is_automated,
+            "start_time": mogi.start_time.isoformat() if mogi.start_time else None,
+            "matchmaking_strategy": mogi.matchmaking_strategy,
+            "started": mogi.started,
+            "gathering": mogi.gathering,
+            "making_rooms_run": mogi.making_rooms_run,
+        }
+        fields.update(extra)
+        self.record("mogi", mogi=mogi_key(mogi), fields=fields)
+
+    def forget(self, mogi):
+        self.record("forget", mogi=mogi_key(mogi))
+
+    def join(self, mogi, team):
+        self.record("join", mogi=mogi_key(mogi), team=_team_state(team))
+
+    def drop(self, mogi, team):
+        self.record("drop", mogi=mogi_key(mogi), member_id=team.players[0].member.id)
+
+    def room(self, mogi, room):
+        self.record("room", mogi=mogi_key(mogi), thread_id=room.thread.id,
+                    room_num=room.room_num)
+
+    def room_teams(self, mogi, room, player_list):
+        self.record("room_teams", mogi=mogi_key(mogi), thread_id=room.thread.id,
+                    teams=[[p.member.id for p in team.players] for team in room.teams],
+                    players=[p.member.id for p in player_list],
+                    mmr_low=room.mmr_low, mmr_high=room.mmr_high)
+
+    def vote(self, mogi, room, view):
+        self.record("vote", mogi=mogi_key(mogi), thread_id=room.thread.id,
+                    teams=[[p.member.id for p in team.players] for team in room.teams],
+                    mmr_average=room.mmr_average, header_text=view.header_text,
+                    teams_text=view.teams_text)
+
+    def room_history(self, mogi, room):
+        self.record("room_history", mogi=mogi_key(mogi), thread_id=room.thread.id)
+
+    def own_message(self, message, expires_at=None):
+        """Remembers a message the bot posted, so it can be cleaned up after a restart."""
+        self.record("own", channel_id=message.channel.id, message_id=message.id,
+                    expires_at=expires_at)
+
+    def disown_messages(self, message_ids):
+        if message_ids:
+            self.record("disown", message_ids=list(message_ids))
+
+    def owned_messages(self):
+        """message id -> (channel id, expiry time or None)"""
+        return {int(message_id): tuple(value)
+                for message_id, value in self.state["messages"].items()}
+
+    def score(self, mogi, room, player):
+        self.record("score", mogi=mogi_key(mogi), thread_id=room.thread.id,
+                    member_id=player.member.id, score=player.score)
+
+
+def parse_time(value):
+    return datetime.fromisoformat(value) if value else None
@@ -0,0 +1,266 @@
+"""Room partitioning for a gathered mogi.
+
+Every strategy takes the registered teams in join order and the number of
+teams per room, and returns (rooms, late_teams): a list of rooms, each a list
+of teams sorted by MMR from highest to lowest, and the teams that didn't get
+a room, in join order.  Teams only need an avg_mmr attribute.
+
+balanced_teams splits the players of a single room into teams for the
+winning format.
+
+Run as a script to compare the strategies on a JSON list of players:
+
+    python matchmaking.py players.json --strategy all
+    python matchmaking.py --generate 5000 > players.json
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+
+def sorted_slice(teams, teams_per_room):
+    """The original behaviour: the last teams to join are late, the rest are
+    sorted by MMR and sliced into rooms."""
+    num_teams = len(teams) // teams_per_room * teams_per_room
+    sorted_list = sorted(teams[:num_teams], key=lambda team: team.avg_mmr, reverse=True)
+    rooms = [sorted_list[i:i+teams_per_room] for i in range(0, num_teams, teams_per_room)]
+    return rooms, teams[num_teams:]
+
+
+def _partition(teams, teams_per_room, eligible):
+    """Picks which teams sit out so that the sum of the rooms' MMR spreads is
+    as small as possible, only ever leaving out teams for which eligible(index)
+    is true.  Ties go to leaving out the teams that joined last.
+
+    With the teams sorted by MMR, rooms are runs of consecutive teams and the
+    teams left out sit between runs, so a dynamic program over
+    (position, teams left out) finds the best split in O(n * teams_per_room)
+    after an O(n log n) sort."""
+    n = len(teams)
+    num_late = n % teams_per_room
+    order = sorted(range(n), key=lambda i: teams[i].avg_mmr, reverse=True)
+    mmr = [teams[i].avg_mmr for i in order]
+    inf = (float("inf"), 0)
+    # best[i][j]: cost of the first i sorted teams with j of them left out,
+    # only meaningful on room boundaries where (i - j) % teams_per_room == 0
+    best = [[inf] * (num_late + 1) for _ in range(n + 1)]
+    # how each state was reached: True if team i-1 was left out, False if a room ended there
+    came_from_late = [[False] * (num_late + 1) for _ in range(n + 1)]
+    best[0][0] = (0, 0)
+    for i in range(n + 1):
+        for j in range(num_late + 1):
+            cost = best[i][j]
+            if cost == inf or (i - j) % teams_per_room:
+                continue
+            if j < num_late and i < n and eligible(order[i]):
+                # leaving out an early joiner costs more than leaving out a late one
+                candidate = (cost[0], cost[1] + n - order[i])
+                if candidate < best[i+1][j+1]:
+                    best[i+1][j+1] = candidate
+                    came_from_late[i+1][j+1] = True
+            end = i + teams_per_room
+            if end <= n:
+                candidate = (cost[0] + mmr[i] - mmr[end-1], cost[1])
+                if candidate < best[end][j]:
+                    best[end][j] = candidate
+                    came_from_late[end][j] = False
+    if best[n][num_late] == inf:
+        return None
+
+    rooms = []
+    late = []
+    i, j = n, num_late
+    while i > 0:
+        if came_from_late[i][j]:
+            late.append(order[i-1])
+            i -= 1
+            j -= 1
+        else:
+            rooms.append([teams[k] for k in order[i-teams_per_room:i]])
+            i -= teams_per_room
+    rooms.reverse()
+    return rooms, [teams[k] for k in sorted(late)]
+
+
+def min_spread(teams, teams_per_room):
+    """Leaves out whichever teams make the rooms' MMR ranges tightest,
+    regardless of when they joined."""
+    return _partition(teams, teams_per_room, lambda index: True)
+
+
+def late_fair(teams, teams_per_room, window=2):
+    """Only the last joiners can be left out, as with sorted_slice, but the
+    choice among the last window * (number left out) teams is made to keep
+    the rooms' MMR ranges tight instead of strictly by join order."""
+    num_late = len(teams) % teams_per_room
+    first_eligible = len(teams) - window * num_late
+    result = _partition(teams, teams_per_room, lambda index: index >= first_eligible)
+    if result is None:
+        return sorted_slice(teams, teams_per_room)
+    return result
+
+
+STRATEGIES = {
+    "sorted": sorted_slice,
+    "min_spread": min_spread,
+    "late_fair": late_fair,
+}
+
+
+def make_rooms(teams, teams_per_room, strategy="sorted"):
+    if strategy not in STRATEGIES:
+        print(f"Unknown matchmaking strategy {strategy}, using sorted", flush=True)
+        strategy = "sorted"
+    return STRATEGIES[strategy](list(teams), teams_per_room)
+
+
+def _team_gap(totals):
+    return max(totals) - min(totals)
+
+
+def _split_cost(totals):
+    # the gap first; the sum of squares breaks ties, so the search can still
+    # move between teams that aren't the strongest or the weakest
+    return (max(totals) - min(totals), sum([total * total for total in totals]))
+
+
+def _improve(teams, totals, deadline=None):
+    """Local search: keeps applying the player swap between two teams that
+    most reduces the gap between the strongest and weakest team.  Returns
+    False if it was cut short by the deadline."""
+    num_teams = len(teams)
+    while True:
+        if deadline is not None and time.perf_counter() > deadline:
+            return False
+        cost = _split_cost(totals)
+        best = None
+        for a in range(num_teams):
+            for b in range(a + 1, num_teams):
+                for i, player_a in enumerate(teams[a]):
+                    for j, player_b in enumerate(teams[b]):
+                        delta = player_b.mmr - player_a.mmr
+                        if delta == 0:
+                            continue
+                        totals[a] += delta
+                        totals[b] -= delta
+                        new_cost = _split_cost(totals)
+                        totals[a] -= delta
+                        totals[b] += delta
+                        if new_cost < cost:
+                            cost = new_cost
+                            best = (a, b, i, j, delta)
+        if best is None:
+            return True
+        a, b, i, j, delta = best
+        teams[a][i], teams[b][j] = teams[b][j], teams[a][i]
+        totals[a] += delta
+        totals[b] -= delta
+
+
+def balanced_teams(players, team_size, time_budget=0.003, tolerance=0.01):
+    """Splits players into teams of team_size with MMR totals as even as possible.
+
+    A snake draft on the sorted players gives a good first split, and local
+    search from random starting splits looks for better ones until time_budget
+    seconds have passed; only the first search may run past the budget.  The
+    result is picked at random among the splits whose gap is within tolerance
+    (a fraction of the average team total) of the best one found, so rooms
+    don't always get the same teams for the same players."""
+    players = list(players)
+    if team_size == 1:
+        random.shuffle(players)
+        return [[player] for player in players]
+    deadline = time.perf_counter() + time_budget
+    num_teams = len(players) // team_size
+
+    def search(start, deadline=None):
+        teams = [start[k*team_size:(k+1)*team_size] for k in range(num_teams)]
+        totals = [sum([p.mmr for p in team]) for team in teams]
+        if not _improve(teams, totals, deadline):
+            return None
+        return teams, _team_gap(totals)
+
+    # snake draft: 1 2 3 3 2 1 1 2 3 ...
+    ranked = sorted(players, key=lambda p: p.mmr, reverse=True)
+    draft = [[] for _ in range(num_teams)]
+    for k, player in enumerate(ranked):
+        lap, pos = divmod(k, num_teams)
+        draft[pos if lap % 2 == 0 else num_teams - 1 - pos].append(player)
+    found = [search([p for team in draft for p in team])]
+    while time.perf_counter() < deadline:
+        start = players[:]
+        random.shuffle(start)
+        result = search(start, deadline)
+        if result is not None:
+            found.append(result)
+
+    best_gap = min(gap for _, gap in found)
+    margin = tolerance * sum([p.mmr for p in players]) / num_teams
+    near_best = [teams for teams, gap in found if gap <= best_gap + margin]
+    return random.choice(near_best)
+
+
+class BenchTeam:
+    __slots__ = ("names", "avg_mmr")
+
+    def __init__(self, names, avg_mmr):
+        self.names = names
+        self.avg_mmr = avg_mmr
+
+
+def load_teams(path, size):
+    """Reads a JSON list of players ({"name", "mmr"}) in join order and groups
+    every `size` consecutive players into a team."""
+    with open(path, "r") as f:
+        players = json.load(f)
+    teams = []
+    for i in range(0, len(players) - size + 1, size):
+        group = players[i:i+size]
+        teams.append(BenchTeam([p["name"] for p in group],
+                               sum([p["mmr"] for p in group]) / size))
+    return teams
+
+
+def describe(rooms, late):
+    spreads = [room[0].avg_mmr - room[-1].avg_mmr for room in rooms]
+    if not spreads:
+        return f"0 rooms, {len(late)} late"
+    return (f"{len(rooms)} rooms, {len(late)} late, "
+            f"mean spread {sum(spreads) / len(spreads):.1f}, max spread {max(spreads):.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare room partitioning strategies offline.")
+    parser.add_argument("players", nargs="?", help="JSON list of players in join order")
+    parser.add_argument("--strategy", default="all", choices=["all"] + list(STRATEGIES))
+    parser.add_argument("--size", type=int, default=1, help="players per team")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per strategy")
+    parser.add_argument("--generate", type=int, metavar="N",
+                        help="print a random list of N players instead")
+    args = parser.parse_args(argv)
+
+    if args.generate:
+        players = [{"name": f"Player{i+1}", "mmr": max(0, int(random.gauss(6000, 2500)))}
+                   for i in range(args.generate)]
+        json.dump(players, sys.stdout)
+        return
+    if not args.players:
+        parser.error("a players file is required")
+
+    teams = load_teams(args.players, args.size)
+    teams_per_room = 12 // args.size
+    strategies = list(STRATEGIES) if args.strategy == "all" else [args.strategy]
+    print(f"{len(teams)} teams, {teams_per_room} teams per room")
+    for name in strategies:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            rooms, late = make_rooms(teams, teams_per_room, name)
+            timings.append(time.perf_counter() - start)
+        print(f"{name:>10}: {describe(rooms, late)}; best {min(timings) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
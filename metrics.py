@@ -0,0 +1,240 @@
+"""Prometheus metrics for the bot.
+
+Everything is recorded in process, always; the numbers are only served when
+"metrics_port" is set in config.json, at http://metrics_host:metrics_port/metrics
+(metrics_host defaults to 127.0.0.1, so the endpoint stays local).
+"""
+import bisect
+import contextlib
+import time
+from aiohttp import web
+
+# seconds; covers a cached lookup up to a slow full player list download
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join([f'{name}="{_escape(value)}"' for name, value in pairs]) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        # sorted (label, value) pairs -> value
+        self._values = {}
+        REGISTRY.append(self)
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+    def clear(self):
+        self._values = {}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in self._values.items():
+            lines += self._render_value(key, value)
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            # per bucket counts (not cumulative), then the sum and the count
+            entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def series(self):
+        """The label sets observed so far, as dicts."""
+        return [dict(key) for key in self._values]
+
+    def totals(self, **labels):
+        """(count, sum) of the observations with these labels."""
+        entry = self._values.get(self._key(labels))
+        return (entry[2], entry[1]) if entry is not None else (0, 0.0)
+
+    def quantile(self, q, **labels):
+        """Upper bound of the bucket holding the q quantile, or None without observations."""
+        entry = self._values.get(self._key(labels))
+        if entry is None:
+            return None
+        rank = q * entry[2]
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), entry[0]):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_value(self, key, entry):
+        counts, total, count = entry
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', _format_value(bound))])} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+REGISTRY = []
+# functions run before every scrape, to set gauges that are cheaper to read than to track
+_collectors = []
+
+COMMAND_LATENCY = Histogram(
+    "queuebot_command_seconds", "Time spent handling a command, by command.")
+LOCK_WAIT = Histogram(
+    "queuebot_lock_wait_seconds", "Time spent waiting for a mogi lock, by caller.")
+LOCK_HOLD = Histogram(
+    "queuebot_lock_hold_seconds", "Time a mogi lock was held, by caller.")
+LOUNGE_LATENCY = Histogram(
+    "queuebot_lounge_request_seconds", "Lounge API request latency, by endpoint.")
+LOUNGE_ERRORS = Counter(
+    "queuebot_lounge_errors_total", "Failed Lounge API requests, by endpoint and status or exception.")
+DISCORD_LATENCY = Histogram(
+    "queuebot_discord_request_seconds", "Discord API request latency including rate limit waits, by route.")
+DISCORD_ERRORS = Counter(
+    "queuebot_discord_errors_total", "Failed Discord API requests, by route and status.")
+OUTBOUND_DEPTH = Gauge(
+    "queuebot_outbound_queue_depth", "Messages waiting in the outbound message scheduler.")
+QUEUE_TEAMS = Gauge(
+    "queuebot_queue_teams", "Teams in the mogi gathering or playing, by queue.")
+QUEUE_CONFIRMED_TEAMS = Gauge(
+    "queuebot_queue_confirmed_teams", "Confirmed teams in the mogi gathering or playing, by queue.")
+
+
+def add_collector(collector):
+    _collectors.append(collector)
+
+
+def remove_collector(collector):
+    if collector in _collectors:
+        _collectors.remove(collector)
+
+
+def render():
+    for collector in _collectors:
+        try:
+            collector()
+        except Exception as e:
+            print(f"Metrics collector failed: {e}", flush=True)
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+@contextlib.asynccontextmanager
+async def timed_lock(lock, caller):
+    """async with timed_lock(mogi.lock, "join"): records how long the caller
+    waited for the lock and how long it held it."""
+    start = time.perf_counter()
+    async with lock:
+        acquired = time.perf_counter()
+        LOCK_WAIT.observe(acquired - start, caller=caller)
+        try:
+            yield
+        finally:
+            LOCK_HOLD.observe(time.perf_counter() - acquired, caller=caller)
+
+
+def instrument_discord_http(http):
+    """Wraps discord.py's HTTPClient.request so every Discord API call is
+    timed and counted by route, e.g. "POST /channels/{channel_id}/messages"."""
+    request = http.request
+    if getattr(request, "instrumented", False):
+        return
+
+    async def timed_request(route, **kwargs):
+        name = f"{route.method} {route.path}"
+        start = time.perf_counter()
+        try:
+            return await request(route, **kwargs)
+        except Exception as e:
+            DISCORD_ERRORS.inc(route=name, status=getattr(e, "status", type(e).__name__))
+            raise
+        finally:
+            DISCORD_LATENCY.observe(time.perf_counter() - start, route=name)
+
+    timed_request.instrumented = True
+    http.request = timed_request
+
+
+class MetricsServer:
+    """Serves render() at /metrics."""
+
+    def __init__(self, port, host="127.0.0.1"):
+        self.port = port
+        self.host = host
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"Serving metrics on http://{self.host}:{self.port}/metrics", flush=True)
+
+    async def handle(self, request):
+        return web.Response(body=render().encode(),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
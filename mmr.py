@@ -1,93 +1,387 @@
 import aiohttp
+import asyncio
+import contextlib
 import discord
+import os
+import pickle
+import sys
+import time
+from collections import OrderedDict
 from mogi_objects import Player
+import metrics
 
 headers = {"Content-type": "application/json"}
 
 
+@contextlib.contextmanager
+def _lounge_request(endpoint):
+    """Times a Lounge API request and counts it as an error if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    except aiohttp.ClientResponseError:
+        # raised for a bad status, which _count_status has already counted
+        raise
+    except Exception as e:
+        metrics.LOUNGE_ERRORS.inc(endpoint=endpoint, reason=type(e).__name__)
+        raise
+    finally:
+        metrics.LOUNGE_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint)
+
+
+def _count_status(endpoint, status):
+    if status not in (200, 304):
+        metrics.LOUNGE_ERRORS.inc(endpoint=endpoint, reason=str(status))
+
+
+class LoungePlayer:
+    """Compact record of the fields the bot uses from /api/player/list."""
+    __slots__ = ("discord_id", "name", "mmr")
+
+    def __init__(self, discord_id: int, name: str, mmr):
+        self.discord_id = discord_id
+        self.name = name
+        self.mmr = mmr
+
+
+def build_lounge_players(players):
+    """Converts decoded API player dicts into LoungePlayer records,
+    dropping players without a linked discord account."""
+    records = []
+    for player in players:
+        if "discordId" not in player:
+            continue
+        records.append(LoungePlayer(int(player["discordId"]),
+                                    sys.intern(player["name"]),
+                                    player.get("mmr")))
+    return tuple(records)
+
+
 class LoungeData:
+    SNAPSHOT_VERSION = 1
+
     def __init__(self):
         self._data = None
+        # lookup indexes, rebuilt on every refresh and swapped in together
+        # so readers never see a half built snapshot
+        self._by_discord_id = {}
+        self._by_name = {}
+        # validators from the last successful download, sent back to the
+        # API so an unchanged leaderboard costs a single 304
+        self.etag = None
+        self.last_modified = None
+        self.fetched_at = None
+        self.snapshot_path = None
 
-    async def lounge_api_full(self):
-        async with aiohttp.ClientSession() as session:
-            async with session.get(
-                "https://www.mk8dx-lounge.com/api/player/list"
+    async def lounge_api_full(self, client):
+        request_headers = {"Accept-Encoding": "gzip"}
+        if self._data is not None:
+            if self.etag:
+                request_headers["If-None-Match"] = self.etag
+            if self.last_modified:
+                request_headers["If-Modified-Since"] = self.last_modified
+        with _lounge_request("player_list"):
+            async with client.session().get(
+                client.url + "/api/player/list",
+                headers=request_headers, timeout=client.list_timeout
             ) as response:
-                if response.status == 200:
-                    _data_full = await response.json()
-                    if len(_data_full["players"]) == 0:
-                        return
-                    self._data = [
-                        player
-                        for player in _data_full["players"]
-                        if "discordId" in player
-                    ]
+                _count_status("player_list", response.status)
+                if response.status == 304:
+                    self.fetched_at = time.time()
+                    return
+                if response.status != 200:
+                    return
+                _data_full = await response.json()
+                if len(_data_full["players"]) == 0:
+                    return
+                records = build_lounge_players(_data_full["players"])
+                # drop the decoded json before building the indexes
+                del _data_full
+                self.set_players(records)
+                self.etag = response.headers.get("ETag")
+                self.last_modified = response.headers.get("Last-Modified")
+                self.fetched_at = time.time()
+                print(f"Lounge data refreshed: {len(records)} players, "
+                      f"{self.memory_usage() / 1024 / 1024:.1f} MiB", flush=True)
+        if self.snapshot_path:
+            await asyncio.to_thread(self.save_snapshot, self.snapshot_path)
+
+    def set_players(self, records):
+        by_discord_id = {player.discord_id: player for player in records}
+        by_name = {player.name.casefold(): player for player in records}
+        self._data, self._by_discord_id, self._by_name = (
+            records, by_discord_id, by_name)
 
     def data(self):
         return self._data
 
+    def find_by_discord_id(self, discord_id):
+        return self._by_discord_id.get(int(discord_id))
+
+    def find_by_name(self, name):
+        return self._by_name.get(name.casefold())
+
+    def is_fresh(self, max_age):
+        return self.fetched_at is not None and time.time() - self.fetched_at <= max_age
+
+    def save_snapshot(self, path):
+        """Writes the current snapshot to disk, replacing the old file atomically."""
+        if self._data is None:
+            return
+        snapshot = {
+            "version": self.SNAPSHOT_VERSION,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "fetched_at": self.fetched_at,
+            "discord_ids": [player.discord_id for player in self._data],
+            "names": [player.name for player in self._data],
+            "mmrs": [player.mmr for player in self._data],
+        }
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Saving lounge snapshot failed: {e}", flush=True)
+
+    async def load_snapshot(self, path):
+        """Loads the last snapshot saved to disk so joins work before the first refresh.
+        Later refreshes save back to the same path."""
+        self.snapshot_path = path
+        snapshot = await asyncio.to_thread(self.read_snapshot, path)
+        if snapshot is None:
+            return False
+        # checked and swapped in on the event loop, so a refresh that finished
+        # while the file was being read can't be overwritten by older data
+        if self.fetched_at is not None and self.fetched_at >= snapshot["fetched_at"]:
+            return False
+        self.set_players(snapshot["players"])
+        self.etag = snapshot["etag"]
+        self.last_modified = snapshot["last_modified"]
+        self.fetched_at = snapshot["fetched_at"]
+        print(f"Loaded lounge snapshot: {len(self._data)} players", flush=True)
+        return True
+
+    def read_snapshot(self, path):
+        """Reads and unpickles a snapshot, with its players as LoungePlayer
+        records.  Returns None if there is no usable snapshot."""
+        try:
+            with open(path, "rb") as f:
+                snapshot = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Loading lounge snapshot failed: {e}", flush=True)
+            return None
+        if snapshot.get("version") != self.SNAPSHOT_VERSION:
+            return None
+        snapshot["players"] = tuple(
+            LoungePlayer(discord_id, sys.intern(name), mmr)
+            for discord_id, name, mmr in zip(
+                snapshot.pop("discord_ids"), snapshot.pop("names"), snapshot.pop("mmrs")))
+        return snapshot
+
+    def memory_usage(self):
+        """Approximate size in bytes of the snapshot and its indexes."""
+        if self._data is None:
+            return 0
+        size = sys.getsizeof(self._data)
+        size += sys.getsizeof(self._by_discord_id)
+        size += sys.getsizeof(self._by_name)
+        for player in self._data:
+            size += sys.getsizeof(player)
+            size += sys.getsizeof(player.discord_id)
+            size += sys.getsizeof(player.name)
+            size += sys.getsizeof(player.mmr)
+        # case-folded copies of the names used as lookup keys
+        for name in self._by_name:
+            size += sys.getsizeof(name)
+        return size
+
 
 lounge_data = LoungeData()
 
 
-async def mk8dx_150cc_mmr(url, members):
-    base_url = url + "/api/player?"
-    players = []
-    timeout = aiohttp.ClientTimeout(total=10)
-    try:
-        async with aiohttp.ClientSession(
-            timeout=timeout, auth=aiohttp.BasicAuth("username", "password")
-        ) as session:
-            for member in members:
-                request_text = f"discordId={member.id}"
-                request_url = base_url + request_text
-                async with session.get(request_url, headers=headers) as resp:
-                    if resp.status != 200:
-                        players.append(None)
-                        continue
-                    player_data = await resp.json()
-                    if "mmr" not in player_data.keys():
-                        players.append(Player(member, player_data["name"], None))
-                        continue
-                    players.append(
-                        Player(member, player_data["name"], player_data["mmr"])
-                    )
-    except:
-        print(f"Fetch for player {members[0]} has failed.", flush=True)
-    return players
-
-
-async def get_mmr_from_discord_id(discord_id):
-    base_url = "https://www.mk8dx-lounge.com" + "/api/player?"
-    timeout = aiohttp.ClientTimeout(total=10)
-    async with aiohttp.ClientSession(
-        timeout=timeout, auth=aiohttp.BasicAuth("username", "password")
-    ) as session:
+class TTLCache:
+    """Size bounded cache whose entries expire after their own time to live."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        # key -> (expires_at, value), least recently used first
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Returns (hit, value)."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def set(self, key, value, ttl):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LoungeClient:
+    """Long lived HTTP client for the Lounge API.
+
+    Every lookup goes through one pooled session, so repeat calls reuse warm
+    keep-alive connections instead of paying a new TCP+TLS handshake."""
+
+    def __init__(self, url, username=None, password=None, limit_per_host=10,
+                 timeout=10, list_timeout=120, fc_timeout=15, dns_cache_ttl=300, keepalive_timeout=60,
+                 max_concurrency=8, mmr_cache_ttl=60, mmr_negative_cache_ttl=10,
+                 mmr_cache_size=1024, snapshot_max_age=900, data=lounge_data):
+        # base URL of the Lounge API, e.g. config["url"] or a local stand-in
+        self.url = url.rstrip("/")
+        self.auth = aiohttp.BasicAuth(username, password) if username else None
+        self.limit_per_host = limit_per_host
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        # the full player list is a much bigger download than a single lookup
+        self.list_timeout = aiohttp.ClientTimeout(total=list_timeout)
+        # friend code lookups have always been given a little longer
+        self.fc_timeout = aiohttp.ClientTimeout(total=fc_timeout)
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        # default cap on concurrent requests for batched lookups
+        self.max_concurrency = max_concurrency
+        # sub button lookups: served from the player list snapshot while it is
+        # fresh, then from a short lived cache, and concurrent lookups for the
+        # same discord id share one request
+        self.data = data
+        self.snapshot_max_age = snapshot_max_age
+        self.mmr_cache = TTLCache(mmr_cache_size)
+        self.mmr_cache_ttl = mmr_cache_ttl
+        self.mmr_negative_cache_ttl = mmr_negative_cache_ttl
+        self._mmr_inflight = {}
+        self._session = None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config["url"], config.get("username"), config.get("password"),
+                   limit_per_host=config.get("lounge_connections_per_host", 10),
+                   timeout=config.get("lounge_timeout", 10),
+                   list_timeout=config.get("lounge_list_timeout", 120),
+                   fc_timeout=config.get("lounge_fc_timeout", 15),
+                   max_concurrency=config.get("lounge_max_concurrency", 8),
+                   mmr_cache_ttl=config.get("mmr_cache_ttl", 60),
+                   mmr_negative_cache_ttl=config.get("mmr_negative_cache_ttl", 10),
+                   mmr_cache_size=config.get("mmr_cache_size", 1024),
+                   snapshot_max_age=config.get("lounge_snapshot_max_age", 900))
+
+    def session(self):
+        # created lazily since aiohttp sessions must be made inside the running loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=self.timeout, headers=headers)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def fetch_player(self, member):
+        request_url = self.url + f"/api/player?discordId={member.id}"
+        with _lounge_request("player"):
+            async with self.session().get(request_url, auth=self.auth) as resp:
+                _count_status("player", resp.status)
+                if resp.status != 200:
+                    return None
+                player_data = await resp.json()
+                return Player(member, player_data["name"], player_data.get("mmr"))
+
+    async def lookup_players(self, members, concurrency=None):
+        """Looks up every member concurrently, with at most `concurrency` requests in flight.
+
+        Results are in the same order as members: a Player, None if the member has
+        no lounge account, or the exception raised by that member's lookup."""
+        semaphore = asyncio.Semaphore(concurrency or self.max_concurrency)
+
+        async def fetch(member):
+            async with semaphore:
+                return await self.fetch_player(member)
+
+        return await asyncio.gather(*[fetch(member) for member in members],
+                                    return_exceptions=True)
+
+    async def mk8dx_150cc_mmr(self, members, concurrency=None):
+        players = []
+        results = await self.lookup_players(members, concurrency)
+        for member, result in zip(members, results):
+            # CancelledError is a BaseException, and gather returns it like any other error
+            if isinstance(result, BaseException):
+                print(f"Fetch for player {member} has failed: {result!r}", flush=True)
+                result = None
+            players.append(result)
+        return players
+
+    async def get_mmr_from_discord_id(self, discord_id):
+        discord_id = int(discord_id)
+        if self.data.is_fresh(self.snapshot_max_age):
+            player = self.data.find_by_discord_id(discord_id)
+            if player is not None:
+                return player.mmr if player.mmr is not None else "Player has no mmr"
+        hit, mmr = self.mmr_cache.get(discord_id)
+        if hit:
+            return mmr
+        task = self._mmr_inflight.get(discord_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_mmr(discord_id))
+            self._mmr_inflight[discord_id] = task
+            task.add_done_callback(
+                lambda _: self._mmr_inflight.pop(discord_id, None))
+        # shielded so one impatient caller being cancelled doesn't cancel the others
+        return await asyncio.shield(task)
+
+    async def _fetch_mmr(self, discord_id):
+        mmr = await self._request_mmr(discord_id)
+        # "Player does not exist" and "Player has no mmr" are cached briefly too
+        ttl = self.mmr_cache_ttl if isinstance(mmr, int) else self.mmr_negative_cache_ttl
+        self.mmr_cache.set(discord_id, mmr, ttl)
+        return mmr
+
+    async def _request_mmr(self, discord_id):
+        base_url = self.url + "/api/player?"
         request_text = f"discordId={discord_id}"
         request_url = base_url + request_text
-        async with session.get(request_url, headers=headers) as resp:
-            if resp.status != 200:
-                return "Player does not exist"
-            player_data = await resp.json()
-            if "mmr" not in player_data.keys():
-                return "Player has no mmr"
-            return player_data["mmr"]
-
-
-async def get_mmr(config, members):
-    return await mk8dx_150cc_mmr(config, members)
-
-
-async def mk8dx_150cc_fc(config, name):
-    base_url = config["url"] + "/api/player?"
-    request_url = base_url + f"name={name}"
-    timeout = aiohttp.ClientTimeout(total=15)
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        async with session.get(request_url, headers=headers) as resp:
-            if resp.status != 200:
-                return None
-            player_data = await resp.json()
-            if "switchFc" not in player_data.keys():
-                return None
-            return player_data["switchFc"]
+        with _lounge_request("player"):
+            async with self.session().get(request_url, auth=self.auth) as resp:
+                _count_status("player", resp.status)
+                if resp.status == 404:
+                    return "Player does not exist"
+                # rate limits and server errors are failed lookups, not answers to cache
+                resp.raise_for_status()
+                player_data = await resp.json()
+                if "mmr" not in player_data.keys():
+                    return "Player has no mmr"
+                return player_data["mmr"]
+
+    async def mk8dx_150cc_fc(self, name):
+        base_url = self.url + "/api/player?"
+        request_url = base_url + f"name={name}"
+        with _lounge_request("player_fc"):
+            async with self.session().get(request_url, timeout=self.fc_timeout) as resp:
+                _count_status("player_fc", resp.status)
+                if resp.status != 200:
+                    return None
+                player_data = await resp.json()
+                if "switchFc" not in player_data.keys():
+                    return None
+                return player_data["switchFc"]
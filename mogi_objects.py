@@ -1,85 +1,142 @@
 from discord.ui import View, Button
+import asyncio
 import random
+from matchmaking import make_rooms, balanced_teams
 import discord
 
 
 class Mogi:
     def __init__(self, sq_id: int, size: int, mogi_channel: discord.TextChannel,
-                 is_automated=False, start_time=None):
+                 is_automated=False, start_time=None, matchmaking_strategy="sorted"):
         self.started = False
         self.gathering = False
         self.making_rooms_run = False
         self.sq_id = sq_id
         self.size = size
         self.mogi_channel = mogi_channel
-        self.teams = []
+        # held only while the teams or the gathering state change, never across discord calls
+        self.lock = asyncio.Lock()
+        # teams in join order, registered teams in join order and member id -> team,
+        # all kept up to date by add_team/remove_team/sub_player so joins, drops
+        # and counts don't have to walk every team
+        self._teams = {}
+        self._confirmed = {}
+        self._members = {}
+        # bumped on every change to the teams, so renders of the list can be cached
+        self.version = 0
+        self._snapshot = ()
+        self._snapshot_version = 0
         self.rooms = []
+        self._rooms_by_thread = {}
         self.is_automated = is_automated
+        self.matchmaking_strategy = matchmaking_strategy
         if not is_automated:
             self.start_time = None
         else:
             self.start_time = start_time
 
+    @property
+    def teams(self):
+        return list(self._teams)
+
+    def add_team(self, team):
+        self.version += 1
+        self._teams[team] = None
+        for player in team.players:
+            self._members[player.member.id] = team
+        self.update_registration(team)
+
+    def remove_team(self, team):
+        if team not in self._teams:
+            return
+        self.version += 1
+        del self._teams[team]
+        self._confirmed.pop(team, None)
+        for player in team.players:
+            if self._members.get(player.member.id) is team:
+                del self._members[player.member.id]
+
+    def sub_player(self, team, sub_out, sub_in):
+        self.version += 1
+        team.sub_player(sub_out, sub_in)
+        if self._members.get(sub_out.member.id) is team:
+            del self._members[sub_out.member.id]
+        self._members[sub_in.member.id] = team
+        self.update_registration(team)
+
+    def update_registration(self, team):
+        """Call after a player of the team changes their confirmation."""
+        self.version += 1
+        if team.is_registered():
+            # keeps the original join position if the team was already registered
+            self._confirmed.setdefault(team, None)
+        else:
+            self._confirmed.pop(team, None)
+
     def check_player(self, member):
-        for team in self.teams:
-            if team.has_player(member):
-                return team
-        return None
+        return self._members.get(member.id)
 
     def count_registered(self):
-        count = 0
-        for team in self.teams:
-            if team.is_registered():
-                count += 1
-        return count
+        return len(self._confirmed)
 
     def confirmed_list(self):
-        confirmed = []
-        for team in self.teams:
-            if team.is_registered():
-                confirmed.append(team)
-        return confirmed
+        return list(self._confirmed)
+
+    def confirmed_snapshot(self):
+        """Immutable view of the registered teams, shared by readers until the next change."""
+        if self._snapshot_version != self.version:
+            self._snapshot = tuple(self._confirmed)
+            self._snapshot_version = self.version
+        return self._snapshot
 
     def update_late_players(self):
-        late_player_cutoff = int(len(self.teams) / 12) * 12
-        for idx, team in enumerate(self.teams):
-            lateness = False
-            if idx >= late_player_cutoff:
-                lateness = True
-            team.set_lateness(lateness)
+        rooms, late_teams = make_rooms(
+            self.confirmed_snapshot(), int(12/self.size), self.matchmaking_strategy)
+        for team in self._teams:
+            team.set_lateness(False)
+        for team in late_teams:
+            team.set_lateness(True)
 
     def remove_id(self, squad_id: int):
         confirmed = self.confirmed_list()
         if squad_id < 1 or squad_id > len(confirmed):
             return None
         squad = confirmed[squad_id-1]
-        self.teams.remove(squad)
+        self.remove_team(squad)
         return squad
 
+    def add_room(self, room):
+        self.rooms.append(room)
+        self._rooms_by_thread[room.thread.id] = room
+
     def is_room_thread(self, channel_id: int):
-        for room in self.rooms:
-            if room.thread.id == channel_id:
-                return True
-        return False
+        return channel_id in self._rooms_by_thread
 
     def get_room_from_thread(self, channel_id: int):
-        for room in self.rooms:
-            if room.thread.id == channel_id:
-                return room
-        return None
+        return self._rooms_by_thread.get(channel_id)
 
 
 class Room:
     def __init__(self, teams, room_num: int, thread: discord.Thread):
-        self.teams = teams
+        self.teams = None
+        # member id -> Player for everyone placed in the room
+        self.players = {}
+        if teams is not None:
+            self.set_teams(teams)
         self.room_num = room_num
         self.thread = thread
         self.mmr_average = 0
         self.mmr_high = None
         self.mmr_low = None
         self.view = None
+        # True once the vote is decided and the room's history entry is written
         self.finished = False
 
+    def set_teams(self, teams):
+        self.teams = teams
+        self.players = {
+            player.member.id: player for team in teams for player in team.players}
+
 
 class Team:
     def __init__(self, players):
@@ -166,7 +223,10 @@ class Player:
 
 
 class VoteView(View):
-    def __init__(self, players, thread, mogi, six_vs_six_threshold=10000):
+    FORMATS = {"FFA": 1, "2v2": 2, "3v3": 3, "4v4": 4, "6v6": 6}
+
+    def __init__(self, players, thread, mogi, six_vs_six_threshold=10000, team_split_budget=0.003,
+                 update_delay=1.0, on_decided=None, on_vote=None, formats=None):
         super().__init__()
         self.players = players
         self.thread = thread
@@ -176,40 +236,56 @@ class VoteView(View):
         self.found_winner = False
         self.room_mmr = round(sum([p.mmr for p in self.players]) / 12)
         self.six_vs_six_threshold = six_vs_six_threshold
-        self.__setattr__("FFA", [])
-        self.__setattr__("2v2", [])
-        self.__setattr__("3v3", [])
-        self.__setattr__("4v4", [])
-        self.__setattr__("6v6", [])
-
-        self.add_button("FFA", self.button_callback)
-        self.add_button("2v2", self.button_callback)
-        self.add_button("3v3", self.button_callback)
-        self.add_button("4v4", self.button_callback)
-
-        if self.room_mmr > six_vs_six_threshold:
-            self.add_button("6v6", self.button_callback)
-
-    def __getitem__(self, key):
-        return getattr(self, key)
+        # the formats this room's queue plays, see FORMATS
+        self.formats = list(formats) if formats is not None else list(self.FORMATS)
+        # seconds the team split solver may spend once the format is decided
+        self.team_split_budget = team_split_budget
+        # user id -> format voted for, and the number of votes per format
+        self.votes = {}
+        self.counts = dict.fromkeys(self.FORMATS, 0)
+        # clicks within update_delay seconds of each other share one message edit
+        self.update_delay = update_delay
+        self.message = None
+        self._update_task = None
+        # on_decided(mogi, room, view) is called once the teams are made
+        self.on_decided = on_decided
+        # on_vote(interaction, format_name) is called for every click, e.g. by the recorder
+        self.on_vote = on_vote
+
+        for name in self.offered_formats():
+            self.add_button(name, self.button_callback)
+
+    def offered_formats(self):
+        """The queue's formats, with 6v6 only for rooms above the threshold
+        unless it is all the queue plays."""
+        offered = [name for name in self.formats
+                   if name != "6v6" or self.room_mmr > self.six_vs_six_threshold]
+        return offered or self.formats
 
     def add_button(self, label, callback):
         button = Button(label=f"{label}: 0", custom_id=label)
         button.callback = callback
         self.add_item(button)
 
-    async def make_teams(self, format):
-        random.shuffle(self.players)
+    def vote(self, user_id, format_name):
+        """Records a click: voting for the current choice again removes the vote."""
+        previous = self.votes.pop(user_id, None)
+        if previous is not None:
+            self.counts[previous] -= 1
+        if previous != format_name:
+            self.votes[user_id] = format_name
+            self.counts[format_name] += 1
 
+    async def make_teams(self, format):
         room = self.mogi.get_room_from_thread(self.thread.id)
 
         msg = "**Poll Ended!** \n\n"
-        msg += f"1) FFA - {len(self['FFA'])}\n"
-        msg += f"2) 2v2 - {len(self['2v2'])}\n"
-        msg += f"3) 3v3 - {len(self['3v3'])}\n"
-        msg += f"4) 4v4 - {len(self['4v4'])}\n"
+        msg += f"1) FFA - {self.counts['FFA']}\n"
+        msg += f"2) 2v2 - {self.counts['2v2']}\n"
+        msg += f"3) 3v3 - {self.counts['3v3']}\n"
+        msg += f"4) 4v4 - {self.counts['4v4']}\n"
         if self.room_mmr > self.six_vs_six_threshold:
-            msg += f"5) 6v6 - {len(self['6v6'])}\n"
+            msg += f"5) 6v6 - {self.counts['6v6']}\n"
         msg += f"Winner: {format[1]}\n\n"
 
         room.mmr_average = self.room_mmr
@@ -217,11 +293,9 @@ class VoteView(View):
         msg += self.header_text
         msg += "\n"
 
-        teams = []
         teams_per_room = int(12 / format[0])
-        for j in range(teams_per_room):
-            team = Team(self.players[j*format[0]:(j+1)*format[0]])
-            teams.append(team)
+        teams = [Team(players) for players in balanced_teams(
+            self.players, format[0], self.team_split_budget)]
 
         teams.sort(key=lambda team: team.avg_mmr, reverse=True)
 
@@ -242,37 +316,19 @@ class VoteView(View):
 
         msg += "Decide a host amongst yourselves; room open at :00, penalty at :06. Good luck!"
 
-        room.teams = teams
+        room.set_teams(teams)
 
         self.found_winner = True
+        if self.on_decided is not None:
+            self.on_decided(self.mogi, room, self)
         await self.thread.send(msg)
 
     async def find_winner(self):
         if not self.found_winner:
-            max_votes = 0
-            if len(self["FFA"]) > max_votes:
-                max_votes = len(self["FFA"])
-            if len(self["2v2"]) > max_votes:
-                max_votes = len(self["2v2"])
-            if len(self["3v3"]) > max_votes:
-                max_votes = len(self["3v3"])
-            if len(self["4v4"]) > max_votes:
-                max_votes = len(self["4v4"])
-            if len(self["6v6"]) > max_votes:
-                max_votes = len(self["6v6"])
-
-            winners = []
-
-            if len(self["FFA"]) == max_votes:
-                winners.append((1, "FFA"))
-            if len(self["2v2"]) == max_votes:
-                winners.append((2, "2v2"))
-            if len(self["3v3"]) == max_votes:
-                winners.append((3, "3v3"))
-            if len(self["4v4"]) == max_votes:
-                winners.append((4, "4v4"))
-            if len(self["6v6"]) == max_votes and self.room_mmr > self.six_vs_six_threshold:
-                winners.append((6, "6v6"))
+            formats = self.offered_formats()
+            max_votes = max([self.counts[name] for name in formats])
+            winners = [(self.FORMATS[name], name) for name in formats
+                       if self.counts[name] == max_votes]
 
             winner = random.choice(winners)
 
@@ -280,28 +336,46 @@ class VoteView(View):
                 curr_button.disabled = True
 
             await self.make_teams(winner)
+            await self.update_message()
+
+    def schedule_update(self):
+        if self._update_task is None or self._update_task.done():
+            self._update_task = asyncio.create_task(self._delayed_update())
+
+    async def _delayed_update(self):
+        await asyncio.sleep(self.update_delay)
+        await self.update_message()
+
+    async def update_message(self):
+        """Edits the vote message with the current counts, at most one edit in flight."""
+        if self._update_task is not None and self._update_task is not asyncio.current_task():
+            self._update_task.cancel()
+        self._update_task = None
+        if self.message is None:
+            return
+        for curr_button in self.children:
+            curr_button.label = f"{curr_button.custom_id}: {self.counts[curr_button.custom_id]}"
+        try:
+            await self.message.edit(view=self)
+        except Exception as e:
+            print(e, flush=True)
 
     async def button_callback(self, interaction: discord.Interaction):
-        if not self.found_winner:
-            format_name = interaction.data['custom_id']
-            if interaction.user.id in self[format_name]:
-                self[format_name].remove(interaction.user.id)
-            else:
-                for key in ["FFA", "2v2", "3v3", "4v4", "6v6"]:
-                    if interaction.user.id in self[key]:
-                        self[key].remove(interaction.user.id)
-                self[format_name].append(interaction.user.id)
-            if len(self[format_name]) == 6:
-                if format_name == "FFA":
-                    players_per_team = 1
-                else:
-                    players_per_team = int(format_name[0])
-                await self.make_teams((players_per_team, format_name))
+        await interaction.response.defer()
+        if self.found_winner:
+            return
+        self.message = interaction.message
+        format_name = interaction.data['custom_id']
+        if self.on_vote is not None:
+            self.on_vote(interaction, format_name)
+        self.vote(interaction.user.id, format_name)
+        if self.counts[format_name] == 6:
             for curr_button in self.children:
-                curr_button.label = f"{curr_button.custom_id}: {len(self[curr_button.custom_id])}"
-                if len(self[format_name]) == 6:
-                    curr_button.disabled = True
-        await interaction.response.edit_message(view=self)
+                curr_button.disabled = True
+            await self.make_teams((self.FORMATS[format_name], format_name))
+            await self.update_message()
+        else:
+            self.schedule_update()
 
 
 class JoinView(View):
@@ -0,0 +1,163 @@
+import asyncio
+import heapq
+import itertools
+import time
+import discord
+from queue_list import MESSAGE_LIMIT
+
+# lower values are sent first
+PRIORITY_ROOM = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_HISTORY = 2
+
+
+class TokenBucket:
+    def __init__(self, capacity: int, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+
+    def delay(self):
+        """Seconds until a token is available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self.delay()
+            if wait <= 0:
+                self.tokens -= 1
+                return
+            await asyncio.sleep(wait)
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class OutboundMessage:
+    __slots__ = ("priority", "seq", "content", "kwargs", "coalesce", "future")
+
+    def __init__(self, priority, seq, content, kwargs, coalesce, future):
+        self.priority = priority
+        self.seq = seq
+        self.content = content
+        self.kwargs = kwargs
+        self.coalesce = coalesce
+        self.future = future
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+def _mark_retrieved(future):
+    # fire and forget sends are logged by the worker, don't warn about them again
+    if not future.cancelled():
+        future.exception()
+
+
+class MessageScheduler:
+    """Sends every outbound channel message for the bot.
+
+    Each channel has its own priority queue, drained by its own worker under a
+    token bucket matching Discord's per channel message limit, plus one bucket
+    shared by all channels for the global limit. Small messages queued with
+    coalesce=True are merged into payloads of up to 2000 characters."""
+
+    def __init__(self, per_channel=5, per_channel_period=5.0, global_rate=50, global_period=1.0):
+        self.per_channel = per_channel
+        self.per_channel_period = per_channel_period
+        self._global_bucket = TokenBucket(global_rate, global_period)
+        self._buckets = {}
+        # channel -> heap of OutboundMessage
+        self._queues = {}
+        self._workers = {}
+        self._seq = itertools.count()
+
+    def send(self, channel, content=None, priority=PRIORITY_DEFAULT, coalesce=False, **kwargs):
+        """Queues a message and returns a future resolving to the sent discord.Message.
+        Awaiting it is optional."""
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_mark_retrieved)
+        message = OutboundMessage(priority, next(self._seq), content, kwargs,
+                                  coalesce and content is not None and not kwargs, future)
+        heapq.heappush(self._queues.setdefault(channel, []), message)
+        if channel not in self._workers:
+            self._workers[channel] = asyncio.create_task(self._run(channel))
+        return future
+
+    def depth(self, channel=None):
+        if channel is not None:
+            return len(self._queues.get(channel, ()))
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def close(self):
+        for worker in self._workers.values():
+            worker.cancel()
+        self._workers = {}
+        for queue in self._queues.values():
+            for message in queue:
+                message.future.cancel()
+        self._queues = {}
+
+    def _bucket(self, channel):
+        bucket = self._buckets.get(channel.id)
+        if bucket is None:
+            bucket = TokenBucket(self.per_channel, self.per_channel_period)
+            self._buckets[channel.id] = bucket
+        return bucket
+
+    def _next_batch(self, queue):
+        """Pops the next message, merged with the small messages queued right behind it."""
+        batch = [heapq.heappop(queue)]
+        if not batch[0].coalesce:
+            return batch
+        length = len(batch[0].content)
+        while queue and queue[0].coalesce and queue[0].priority == batch[0].priority:
+            if length + 1 + len(queue[0].content) > MESSAGE_LIMIT:
+                break
+            message = heapq.heappop(queue)
+            length += 1 + len(message.content)
+            batch.append(message)
+        return batch
+
+    async def _run(self, channel):
+        queue = self._queues[channel]
+        bucket = self._bucket(channel)
+        try:
+            while queue:
+                batch = self._next_batch(queue)
+                if len(batch) == 1:
+                    content = batch[0].content
+                else:
+                    content = "\n".join([message.content for message in batch])
+                await bucket.acquire()
+                await self._global_bucket.acquire()
+                try:
+                    sent = await channel.send(content, **batch[0].kwargs)
+                except Exception as e:
+                    if isinstance(e, discord.HTTPException) and e.status == 429:
+                        bucket.block(getattr(e, "retry_after", None) or 1)
+                        for message in batch:
+                            heapq.heappush(queue, message)
+                        continue
+                    print(f"Sending message to {channel} failed: {e}", flush=True)
+                    for message in batch:
+                        if not message.future.done():
+                            message.future.set_exception(e)
+                    continue
+                for message in batch:
+                    if not message.future.done():
+                        message.future.set_result(sent)
+        finally:
+            if self._workers.get(channel) is asyncio.current_task():
+                del self._workers[channel]
+            if not queue:
+                self._queues.pop(channel, None)
@@ -0,0 +1,166 @@
+import asyncio
+import math
+import time
+from collections import deque
+from mogi_objects import Room
+
+
+class MogiDemand:
+    def __init__(self):
+        # monotonic times of recent joins, used to forecast how many rooms are coming
+        self.joins = deque()
+        # rooms whose thread exists but that the mogi doesn't need yet, in room order
+        self.ready = deque()
+        self.failing = False
+
+
+class ThreadProvisioner:
+    """Creates room threads in the background, ahead of demand.
+
+    Joins only record demand; a single background task creates the threads,
+    so nobody waits on create_thread while joining. Rooms are handed to the
+    mogi as soon as enough players are registered for them. Discord allows
+    `budget` thread creations per `budget_period` seconds, so threads for rooms
+    that aren't full yet are only made while more than `reserve` creations are
+    left in the budget, and never more than `rooms_ahead` rooms beyond the one
+    currently filling up."""
+
+    def __init__(self, create_thread, add_room, report_error, budget=50, budget_period=300,
+                 reserve=10, lookahead=60, join_window=60, rooms_ahead=1):
+        # create_thread(mogi, room_num) -> thread, add_room(mogi, room), report_error(mogi, e)
+        self.create_thread = create_thread
+        self.add_room = add_room
+        self.report_error = report_error
+        self.budget = budget
+        self.budget_period = budget_period
+        self.reserve = reserve
+        self.lookahead = lookahead
+        self.join_window = join_window
+        self.rooms_ahead = rooms_ahead
+        self._created = deque()
+        self._demand = {}
+        self._wakeup = asyncio.Event()
+        self._changed = asyncio.Event()
+        self._task = None
+
+    def rooms_needed(self, mogi):
+        return int(mogi.count_registered() / (12/mogi.size))
+
+    def rooms_forecast(self, mogi, demand):
+        """Rooms the mogi is expected to need by the end of the lookahead window."""
+        now = time.monotonic()
+        while demand.joins and demand.joins[0] < now - self.join_window:
+            demand.joins.popleft()
+        join_rate = len(demand.joins) / self.join_window
+        registered = mogi.count_registered()
+        projected = registered + join_rate * self.lookahead
+        # a join burst projects far more rooms than ever fill up, and every
+        # extra thread costs thread budget now and a delete later
+        limit = math.ceil(registered / (12/mogi.size)) + self.rooms_ahead
+        return min(math.ceil(projected / (12/mogi.size)), limit)
+
+    def budget_left(self):
+        now = time.monotonic()
+        while self._created and self._created[0] <= now - self.budget_period:
+            self._created.popleft()
+        return self.budget - len(self._created)
+
+    def request(self, mogi, joined=True):
+        """Records a join (or any change in registrations) and wakes the provisioner."""
+        demand = self._demand.get(mogi)
+        if demand is None:
+            demand = self._demand[mogi] = MogiDemand()
+        if joined:
+            demand.joins.append(time.monotonic())
+        self._hand_ready_rooms(mogi, demand)
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def ensure_rooms(self, mogi, num_rooms, timeout=30):
+        """Waits until the mogi has num_rooms rooms, or timeout runs out."""
+        deadline = time.monotonic() + timeout
+        self.request(mogi, joined=False)
+        while len(mogi.rooms) < num_rooms:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    async def release(self, mogi):
+        """Stops provisioning for the mogi and deletes the threads it didn't use."""
+        demand = self._demand.pop(mogi, None)
+        if demand is None:
+            return
+        for room in demand.ready:
+            try:
+                await room.thread.delete()
+            except Exception as e:
+                print(f"Deleting unused room thread failed: {e}", flush=True)
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _hand_ready_rooms(self, mogi, demand):
+        needed = self.rooms_needed(mogi)
+        while demand.ready and len(mogi.rooms) < needed:
+            self.add_room(mogi, demand.ready.popleft())
+            self._changed.set()
+
+    async def _provision(self, mogi, demand):
+        """Creates the threads the mogi is missing.  Returns seconds until it
+        should be looked at again, or None."""
+        while mogi in self._demand:
+            have = len(mogi.rooms) + len(demand.ready)
+            needed = self.rooms_needed(mogi)
+            wanted = max(needed, self.rooms_forecast(mogi, demand))
+            if have >= wanted:
+                return None
+            budget_left = self.budget_left()
+            if have >= needed and budget_left <= self.reserve:
+                return None
+            if budget_left <= 0:
+                return self._created[0] + self.budget_period - time.monotonic()
+            self._created.append(time.monotonic())
+            try:
+                thread = await self.create_thread(mogi, have + 1)
+            except Exception as e:
+                print(e, flush=True)
+                # report once, not on every retry
+                if not demand.failing:
+                    demand.failing = True
+                    self.report_error(mogi, e)
+                return 5
+            demand.failing = False
+            if mogi not in self._demand:
+                # released while the thread was being made
+                await thread.delete()
+                return None
+            demand.ready.append(Room(None, have + 1, thread))
+            self._hand_ready_rooms(mogi, demand)
+        return None
+
+    async def _run(self):
+        timeout = None
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            timeout = None
+            for mogi, demand in list(self._demand.items()):
+                try:
+                    delay = await self._provision(mogi, demand)
+                except Exception as e:
+                    print(e, flush=True)
+                    delay = 5
+                if delay is not None:
+                    timeout = delay if timeout is None else min(timeout, delay)
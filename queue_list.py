@@ -0,0 +1,68 @@
+MESSAGE_LIMIT = 2000
+
+
+def split_message(msg: str, limit=MESSAGE_LIMIT):
+    """Splits msg on line boundaries into chunks of at most limit characters."""
+    chunks = []
+    lines = []
+    length = 0
+    for line in msg.split("\n"):
+        if lines and length + len(line) + 1 > limit:
+            chunks.append("\n".join(lines) + "\n")
+            lines = []
+            length = 0
+        lines.append(line)
+        length += len(line) + 1
+    bulk_msg = "\n".join(lines) + "\n"
+    if bulk_msg != "\n":
+        chunks.append(bulk_msg)
+    return chunks
+
+
+class QueueListRenderer:
+    """Renders the confirmed list of a mogi into message sized chunks.
+
+    The render is cached against Mogi.version, which every join, drop and sub
+    bumps, so the list is only rebuilt when the queue actually changed.  It is
+    shared by /l and the list channel, so whether the list channel is out of
+    date is tracked on the Queue, not here."""
+
+    def __init__(self, header_reserve=100):
+        # room left in the first chunk for the "Last Updated" line of the list channel
+        self.header_reserve = header_reserve
+        self._mogi = None
+        self._version = None
+        self._chunks = []
+
+    def invalidate(self):
+        self._mogi = None
+
+    def render(self, mogi):
+        if mogi is self._mogi and mogi.version == self._version:
+            return self._chunks
+
+        mogi.update_late_players()
+        # reads the immutable snapshot, so rendering never needs the mogi lock
+        sorted_mogi_list = sorted(mogi.confirmed_snapshot(), reverse=True)
+        lines = ["Current Mogi List:"]
+        for i, team in enumerate(sorted_mogi_list):
+            line = f"{i+1}) " + ", ".join([p.lounge_name for p in team.players])
+            line += f" ({team.players[0].mmr} MMR)"
+            if team.get_lateness():
+                line += " (late)"
+            lines.append(line)
+            if (i + 1) % 12 == 0:
+                lines.append("ㅤ")
+        teams_per_room = int(12/mogi.size)
+        if len(sorted_mogi_list) % teams_per_room != 0:
+            num_next = len(sorted_mogi_list) % teams_per_room
+            num_rooms = int(len(sorted_mogi_list) / teams_per_room)+1
+            lines.append(
+                f"[{num_next}/{teams_per_room}] players for {num_rooms} room(s)")
+        else:
+            lines.append("")
+
+        self._chunks = split_message("\n".join(lines), MESSAGE_LIMIT - self.header_reserve)
+        self._mogi = mogi
+        self._version = mogi.version
+        return self._chunks
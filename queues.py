@@ -0,0 +1,140 @@
+"""The queues the bot runs.
+
+Without a "queues" entry in config.json the bot runs a single queue, named
+"default", from the top level keys.  Otherwise every entry of the "queues"
+list is its own queue, and any key it doesn't set falls back to the top level
+config, e.g.
+
+    "queues": [
+        {"name": "open", "queue_join_channel": 1, "queue_sub_channel": 2,
+         "queue_list_channel": 3, "queue_history_channel": 4},
+        {"name": "high", "queue_join_channel": 5, "queue_sub_channel": 6,
+         "queue_list_channel": 7, "queue_history_channel": 8,
+         "guild_id": 9, "MIN_MMR": 10000, "MATCHMAKING_STRATEGY": "min_spread",
+         "FORMATS": ["4v4", "6v6"]}
+    ]
+
+Every queue needs its own join channel, since that is how commands and
+mogis find their queue.
+"""
+from datetime import datetime, timezone, timedelta
+from mogi_objects import VoteView
+from queue_list import QueueListRenderer
+
+
+class Queue:
+    """One independently scheduled queue: its settings, its channels and its mogis.
+
+    Queues never share a list message, a blocker, a room thread provisioner or
+    a deadline, so a busy queue doesn't hold up the others."""
+
+    def __init__(self, name, config):
+        self.name = name
+        self.guild_id = config["guild_id"]
+        self.join_channel_id = config["queue_join_channel"]
+        self.sub_channel_id = config["queue_sub_channel"]
+        self.list_channel_id = config["queue_list_channel"]
+        self.history_channel_id = config["queue_history_channel"]
+
+        self.GUILD = None
+        self.MOGI_CHANNEL = None
+        self.SUB_CHANNEL = None
+        self.LIST_CHANNEL = None
+        self.HISTORY_CHANNEL = None
+
+        self.MOGI_LIFETIME = config["MOGI_LIFETIME"]
+
+        self.SUB_MESSAGE_LIFETIME_SECONDS = config["SUB_MESSAGE_LIFETIME_SECONDS"]
+
+        self.SIX_VS_SIX_THRESHOLD = config["SIX_VS_SIX_THRESHOLD"]
+
+        # formats the rooms of this queue vote between; players always join on
+        # their own, so this is the queue's format rather than Mogi.size
+        self.FORMATS = config.get("FORMATS", list(VoteView.FORMATS))
+        unknown = [name for name in self.FORMATS if name not in VoteView.FORMATS]
+        if unknown or not self.FORMATS:
+            raise ValueError(f"Queue {name} has unknown or no FORMATS: {unknown}")
+
+        # how rooms are made from the registered teams, see matchmaking.STRATEGIES
+        self.MATCHMAKING_STRATEGY = config.get("MATCHMAKING_STRATEGY", "sorted")
+
+        # time the team split solver may spend per room once a format wins
+        self.TEAM_SPLIT_BUDGET_MS = config.get("TEAM_SPLIT_BUDGET_MS", 3)
+
+        # minimum seconds between two refreshes of the list channel
+        self.LIST_UPDATE_INTERVAL = config.get("LIST_UPDATE_INTERVAL", 10)
+
+        # number of room threads announced concurrently when rooms are made
+        self.ROOM_FANOUT = config.get("ROOM_FANOUT", 10)
+
+        # MMR range allowed to join, for tier restricted queues; None means no limit
+        self.MIN_MMR = config.get("MIN_MMR")
+        self.MAX_MMR = config.get("MAX_MMR")
+
+        # number of minutes before scheduled time that queue should open
+        self.QUEUE_OPEN_TIME = timedelta(minutes=config["QUEUE_OPEN_TIME"])
+
+        # number of minutes after QUEUE_OPEN_TIME that teams can join the mogi
+        self.JOINING_TIME = timedelta(minutes=config["JOINING_TIME"])
+
+        # number of minutes after JOINING_TIME for any potential extra teams to join
+        self.EXTENSION_TIME = timedelta(minutes=config["EXTENSION_TIME"])
+
+        # mogis waiting for their queue to open
+        self.scheduled = []
+        # the mogi that is gathering, or playing until the next one opens
+        self.ongoing = None
+        # start time -> finished mogi, kept until MOGI_LIFETIME runs out
+        self.old = {}
+
+        self.list_messages = []
+        # content last written to each list message, to skip edits that change nothing
+        self.list_message_contents = []
+        self.list_renderer = QueueListRenderer()
+        # (mogi, Mogi.version) the list channel last showed
+        self.list_written = None
+        self.list_updated_at = datetime.now(timezone.utc)
+
+        self.QUEUE_TIME_BLOCKER = datetime.now(timezone.utc)
+        self.sq_times = []
+
+        # set by the cog, see provisioner.ThreadProvisioner
+        self.provisioner = None
+
+    def resolve_channels(self, bot):
+        self.GUILD = bot.get_guild(self.guild_id)
+        self.MOGI_CHANNEL = bot.get_channel(self.join_channel_id)
+        self.SUB_CHANNEL = bot.get_channel(self.sub_channel_id)
+        self.LIST_CHANNEL = bot.get_channel(self.list_channel_id)
+        self.HISTORY_CHANNEL = bot.get_channel(self.history_channel_id)
+
+    def accepts(self, mmr):
+        if self.MIN_MMR is not None and mmr < self.MIN_MMR:
+            return False
+        if self.MAX_MMR is not None and mmr > self.MAX_MMR:
+            return False
+        return True
+
+    def mogis(self):
+        mogis = list(self.scheduled)
+        if self.ongoing is not None:
+            mogis.append(self.ongoing)
+        mogis.extend(self.old.values())
+        return mogis
+
+
+def load_queues(config):
+    """Returns name -> Queue for the queues in config."""
+    entries = config.get("queues") or [{"name": "default"}]
+    queues = {}
+    join_channels = set()
+    for i, entry in enumerate(entries):
+        name = entry.get("name", f"queue{i + 1}")
+        merged = {**config, **entry}
+        if name in queues:
+            raise ValueError(f"Queue name {name} is used twice")
+        if merged["queue_join_channel"] in join_channels:
+            raise ValueError(f"Queue {name} shares its join channel with another queue")
+        join_channels.add(merged["queue_join_channel"])
+        queues[name] = Queue(name, merged)
+    return queues
@@ -0,0 +1,130 @@
+"""Opt-in recording of the traffic the queue handles, for tools/replay.py.
+
+Set "record_path" in config.json to record; a path ending in .gz is
+compressed.  Every start writes a new file, with the start time added to the
+name (recording.jsonl.gz becomes recording-20261018-195700.jsonl.gz), so a
+restart never overwrites the recording of what led up to it.  Events are
+buffered and written out once a second.  The file is JSON lines: a header
+with the config (without credentials) and the journal state at startup, then
+one array per event, [seconds since the header, kind, ...]:
+
+    ["cmd", name, user id, user name, channel, lounge name, mmr]   /c /d /sub /l
+    ["vote", user id, user name, channel, format]                   vote button click
+    ["msg", user id, user name, channel, content]                   message in a room thread
+    ["tick", key]                                                   deadline coming up
+
+A channel is the channel id, or [mogi key, room number] for room threads,
+since thread ids differ between a recording and its replay.  Lounge name and
+MMR are only set for /c.
+"""
+import asyncio
+import gzip
+import json
+import os
+import time
+from journal import mogi_key
+from mogi_objects import Mogi, Room
+
+# the slash commands worth replaying; everything else is staff or read only
+RECORDED_COMMANDS = ("c", "d", "sub", "l")
+
+# config keys never written to a recording
+SECRET_KEYS = ("token", "username", "password")
+
+# seconds between writes of the buffered events
+FLUSH_INTERVAL = 1.0
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def recording_path(path, started_at):
+    directory, name = os.path.split(path)
+    stem, dot, extension = name.partition(".")
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime(started_at))
+    return os.path.join(directory, f"{stem}-{stamp}{dot}{extension}")
+
+
+def describe_key(key):
+    """A deadline key with mogis and rooms replaced by names that survive a replay."""
+    parts = key if isinstance(key, tuple) else (key,)
+    described = []
+    for part in parts:
+        if isinstance(part, Mogi):
+            described.append(mogi_key(part))
+        elif isinstance(part, Room):
+            described.append(f"room {part.room_num}")
+        else:
+            described.append(str(part))
+    return described
+
+
+class Recorder:
+    def __init__(self, path, config, state):
+        # event times are wall clock offsets, like the deadlines they are replayed against
+        self.started_at = time.time()
+        self.path = recording_path(path, self.started_at)
+        self._buffer = []
+        self._flush_handle = None
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = _open(self.path, "w")
+        print(f"Recording the queue to {self.path}", flush=True)
+        self._write({"version": 1, "started_at": self.started_at,
+                     "config": {key: value for key, value in config.items() if key not in SECRET_KEYS},
+                     "state": state})
+
+    def _write(self, line):
+        if self._file is None:
+            return
+        self._buffer.append(json.dumps(line, separators=(",", ":")) + "\n")
+        if self._flush_handle is None:
+            # writing and flushing per event would block the event loop, and
+            # costs a sync flush of the compressor every time for .gz files
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.flush()
+                return
+            self._flush_handle = loop.call_later(FLUSH_INTERVAL, self.flush)
+
+    def flush(self):
+        self._flush_handle = None
+        if self._file is None or not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        try:
+            self._file.write("".join(lines))
+            self._file.flush()
+        except Exception as e:
+            print(f"Writing to the recording failed: {e}", flush=True)
+
+    def record(self, kind, *fields):
+        self._write([round(time.time() - self.started_at, 3), kind, *fields])
+
+    def tick(self, key):
+        self.record("tick", describe_key(key))
+
+    def close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_recording(path):
+    """Returns (header, events) of a recording; a torn last line is skipped."""
+    with _open(path, "r") as f:
+        header = json.loads(f.readline())
+        events = []
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                break
+    return header, events
@@ -2,4 +2,4 @@
 docker build --tag mogi-queuebot .
 docker stop mogi-queuebot
 docker rm mogi-queuebot
-docker run -d --name mogi-queuebot --restart unless-stopped mogi-queuebot
\ No newline at end of file
+docker run -d --name mogi-queuebot --restart unless-stopped -v mogi-queuebot-data:/app/data mogi-queuebot
\ No newline at end of file
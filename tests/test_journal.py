@@ -0,0 +1,102 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from journal import Journal
+
+START = datetime(2026, 10, 18, 20, 0, tzinfo=timezone.utc)
+
+
+def make_player(member_id, mmr):
+    return SimpleNamespace(member=SimpleNamespace(id=member_id), lounge_name=f"Player{member_id}",
+                           mmr=mmr, confirmed=True, score=0)
+
+
+def make_mogi():
+    channel = SimpleNamespace(id=1001, guild=SimpleNamespace(id=1))
+    return SimpleNamespace(mogi_channel=channel, sq_id=7, size=2, is_automated=True, start_time=START,
+                           matchmaking_strategy="sorted_slice", started=True, gathering=False,
+                           making_rooms_run=True)
+
+
+def record_everything(journal, compact_after=None):
+    """Records one of every kind of entry, taking a snapshot after the
+    `compact_after`th step if it is set."""
+    mogi = make_mogi()
+    teams = [SimpleNamespace(players=[make_player(i, 5000 + i), make_player(i + 100, 6000 + i)])
+             for i in range(1, 5)]
+    room = SimpleNamespace(thread=SimpleNamespace(id=555), room_num=1, teams=teams[:2],
+                           mmr_low=5001, mmr_high=6002, mmr_average=5501.5)
+    player_list = [player for team in room.teams for player in team.players]
+    view = SimpleNamespace(header_text="**Poll Ended!**\n\n1) FORMAT: 2v2", teams_text="`Team 1:` ...")
+    message = SimpleNamespace(id=999, channel=SimpleNamespace(id=1003))
+
+    steps = [
+        lambda: journal.settings("main", START, [START, START.replace(hour=22)]),
+        lambda: journal.mogi(mogi, "ongoing", votes_end_at=1234.5),
+        *[lambda team=team: journal.join(mogi, team) for team in teams],
+        lambda: journal.drop(mogi, teams[3]),
+        lambda: journal.room(mogi, room),
+        lambda: journal.room_teams(mogi, room, player_list),
+        lambda: journal.vote(mogi, room, view),
+        lambda: journal.room_history(mogi, room),
+        lambda: setattr(player_list[0], "score", 82),
+        lambda: journal.score(mogi, room, player_list[0]),
+        lambda: journal.own_message(message, expires_at=2000.0),
+        lambda: journal.disown_messages([message.id]),
+        lambda: journal.settings("main", START.replace(hour=21), []),
+    ]
+    for i, step in enumerate(steps):
+        step()
+        if compact_after is not None and i == compact_after:
+            journal.snapshot()
+
+
+def reopen(directory):
+    journal = Journal(directory)
+    state = journal.recover()
+    journal.close()
+    return journal, state
+
+
+@pytest.mark.parametrize("compact_after", [None, 0, 6, 12])
+def test_recover_matches_recorded_state(tmp_path, compact_after):
+    journal = Journal(str(tmp_path))
+    journal.recover()
+    record_everything(journal, compact_after)
+    expected = journal.state
+    journal.close()
+
+    recovered, state = reopen(str(tmp_path))
+    assert recovered.restored
+    assert state == expected
+    assert recovered.seq == journal.seq
+
+    mogi = next(iter(state["mogis"].values()))
+    assert len(mogi["teams"]) == 3
+    room = mogi["rooms"]["555"]
+    assert room["history_written"] and room["scores"] == {"1": 82}
+    assert state["messages"] == {}
+
+    # recovering compacts into a snapshot, which must recover the same state again
+    _, state = reopen(str(tmp_path))
+    assert state == expected
+
+
+def test_recover_skips_torn_last_line(tmp_path):
+    journal = Journal(str(tmp_path))
+    journal.recover()
+    record_everything(journal)
+    expected = journal.state
+    journal._file.write('{"seq": 10000, "op": "jo')
+    journal.close()
+
+    _, state = reopen(str(tmp_path))
+    assert state == expected
+
+
+def test_nothing_to_recover(tmp_path):
+    journal, state = reopen(str(tmp_path))
+    assert not journal.restored
+    assert state == {"settings": {}, "mogis": {}, "messages": {}}
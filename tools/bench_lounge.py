@@ -0,0 +1,189 @@
+"""Benchmarks the Lounge client in mmr.py against the local stand-in server.
+
+For every leaderboard size a stand-in server (tools/lounge_server.py) is
+started in its own process, so its memory and CPU stay out of the numbers,
+and the benchmark measures:
+
+- refresh: a full /api/player/list download and index build, then a
+  conditional refresh answered with 304
+- peak memory: the highest traced Python allocation during a full refresh,
+  and the size of the snapshot that is kept afterwards
+- lookups: snapshot lookups by discord id, get_mmr_from_discord_id served
+  from the snapshot, and API lookups with a stale snapshot at a given
+  concurrency, with p50/p99 latency and errors
+
+    python -m tools.bench_lounge --sizes 10000 100000 500000
+    python -m tools.bench_lounge --sizes 100000 --latency 0.05 --error-rate 0.01 --json bench.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from mmr import LoungeClient, LoungeData
+from tools.lounge_server import FIRST_DISCORD_ID
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+
+async def start_server(args, players, port):
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "tools.lounge_server", "--players", str(players), "--port", str(port),
+        "--latency", str(args.latency), "--error-rate", str(args.error_rate), "--seed", str(args.seed),
+        stdout=asyncio.subprocess.DEVNULL)
+    # generating and encoding a big leaderboard takes a while
+    deadline = time.monotonic() + 300
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return process
+        except OSError:
+            if process.returncode is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"The stand-in server on port {port} didn't start")
+            await asyncio.sleep(0.2)
+
+
+def make_client(url, data, args):
+    return LoungeClient(url, data=data, max_concurrency=args.concurrency,
+                        limit_per_host=args.concurrency, mmr_cache_size=args.api_lookups * 2)
+
+
+def linked_ids(players, count, rng):
+    """Random discord ids of players the stand-in has a discord account for."""
+    indexes = [i for i in rng.sample(range(players), min(players, count * 2)) if i % 50 != 49]
+    return [FIRST_DISCORD_ID + i for i in indexes[:count]]
+
+
+async def bench_size(args, url, players, rng):
+    result = {"players": players}
+
+    data = LoungeData()
+    client = make_client(url, data, args)
+    start = time.perf_counter()
+    await data.lounge_api_full(client)
+    result["refresh_seconds"] = time.perf_counter() - start
+    if data.data() is None:
+        raise RuntimeError(f"Downloading the player list from {url} failed")
+    result["snapshot_players"] = len(data.data())
+    result["snapshot_bytes"] = data.memory_usage()
+    start = time.perf_counter()
+    await data.lounge_api_full(client)
+    result["refresh_304_seconds"] = time.perf_counter() - start
+
+    # a second cold refresh under tracemalloc, which slows it down too much to time it
+    traced = LoungeData()
+    tracemalloc.start()
+    await traced.lounge_api_full(client)
+    result["refresh_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del traced
+    await client.close()
+
+    ids = linked_ids(players, args.lookups, rng)
+    start = time.perf_counter()
+    for discord_id in ids:
+        data.find_by_discord_id(discord_id)
+    result["snapshot_lookups_per_second"] = len(ids) / (time.perf_counter() - start)
+
+    client = make_client(url, data, args)
+    start = time.perf_counter()
+    for discord_id in ids:
+        await client.get_mmr_from_discord_id(discord_id)
+    result["fresh_mmr_lookups_per_second"] = len(ids) / (time.perf_counter() - start)
+    await client.close()
+
+    # an empty snapshot is never fresh, so every lookup goes to the API
+    client = make_client(url, LoungeData(), args)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    errors = 0
+
+    async def lookup(discord_id):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                mmr = await client.get_mmr_from_discord_id(discord_id)
+            except Exception:
+                mmr = None
+            latencies.append(time.perf_counter() - start)
+            # every id asked for exists, so anything but an MMR or "no mmr" is an error
+            if not isinstance(mmr, int) and mmr != "Player has no mmr":
+                errors += 1
+
+    api_ids = linked_ids(players, args.api_lookups, rng)
+    start = time.perf_counter()
+    await asyncio.gather(*[lookup(discord_id) for discord_id in api_ids])
+    elapsed = time.perf_counter() - start
+    await client.close()
+    result.update({
+        "api_lookups": len(api_ids),
+        "api_lookups_per_second": len(api_ids) / elapsed,
+        "api_p50_seconds": percentile(latencies, 0.5),
+        "api_p99_seconds": percentile(latencies, 0.99),
+        "api_errors": errors,
+    })
+    return result
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    results = []
+    for players in args.sizes:
+        if args.url:
+            results.append(await bench_size(args, args.url, players, rng))
+            continue
+        process = await start_server(args, players, args.port)
+        try:
+            results.append(await bench_size(args, f"http://127.0.0.1:{args.port}", players, rng))
+        finally:
+            process.terminate()
+            await process.wait()
+    return results
+
+
+def print_results(results):
+    print(f"{'players':>8} {'refresh s':>9} {'304 s':>7} {'peak MiB':>8} {'kept MiB':>8} "
+          f"{'snap/s':>10} {'mmr/s':>9} {'api/s':>7} {'api p50':>8} {'api p99':>8} {'errors':>6}")
+    for r in results:
+        print(f"{r['players']:>8} {r['refresh_seconds']:>9.2f} {r['refresh_304_seconds']:>7.3f} "
+              f"{r['refresh_peak_bytes'] / 2**20:>8.1f} {r['snapshot_bytes'] / 2**20:>8.1f} "
+              f"{r['snapshot_lookups_per_second']:>10.0f} {r['fresh_mmr_lookups_per_second']:>9.0f} "
+              f"{r['api_lookups_per_second']:>7.0f} {r['api_p50_seconds'] * 1000:>6.1f}ms "
+              f"{r['api_p99_seconds'] * 1000:>6.1f}ms {r['api_errors']:>6}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Lounge client against a local stand-in API.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 500000],
+                        help="leaderboard sizes to benchmark")
+    parser.add_argument("--url", help="benchmark an already running server instead; "
+                                      "--sizes must then match its size")
+    parser.add_argument("--port", type=int, default=8181)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per single player lookup")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of lookups answered with a 500")
+    parser.add_argument("--lookups", type=int, default=100000, help="snapshot lookups to time")
+    parser.add_argument("--api-lookups", type=int, default=1000, help="API lookups to time")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
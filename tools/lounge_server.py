@@ -0,0 +1,106 @@
+"""Local stand-in for the Lounge API, for load testing mmr.py.
+
+Serves a synthetic leaderboard from the endpoints the bot uses:
+
+    GET /api/player/list                 every player, gzip and ETag aware
+    GET /api/player?discordId=<id>       one player, or 404
+    GET /api/player?name=<name>          one player, or 404
+
+Single player lookups wait --latency seconds (with --jitter spread) and fail
+with a 500 for a share --error-rate of requests.  Discord ids are
+1000000 + the player's index, and names are Player<index + 1>.  Point the bot
+or the benchmark at it with "url": "http://127.0.0.1:8181".
+
+    python -m tools.lounge_server --players 100000 --latency 0.05 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import random
+from aiohttp import web
+
+FIRST_DISCORD_ID = 1000000
+
+
+def generate_players(count, seed=0):
+    """Player dicts shaped like the Lounge API's, with a few of the odd ones:
+    every 50th player has no linked discord account and every 20th no MMR yet."""
+    rng = random.Random(seed)
+    players = []
+    for i in range(count):
+        player = {"playerId": i + 1, "name": f"Player{i + 1}",
+                  "switchFc": f"{rng.randrange(10**12):012d}", "eventsPlayed": rng.randrange(500)}
+        if i % 50 != 49:
+            player["discordId"] = str(FIRST_DISCORD_ID + i)
+        if i % 20 != 19:
+            player["mmr"] = max(0, int(rng.gauss(6000, 2500)))
+        players.append(player)
+    return players
+
+
+class LoungeStandIn:
+    def __init__(self, players, latency=0.0, jitter=0.5, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.by_discord_id = {player["discordId"]: player for player in players if "discordId" in player}
+        self.by_name = {player["name"].casefold(): player for player in players}
+        # the list is encoded once; it only changes when the server restarts
+        self.list_body = json.dumps({"players": players}, separators=(",", ":")).encode()
+        self.list_body_gzip = gzip.compress(self.list_body, compresslevel=5)
+        self.etag = '"' + hashlib.sha1(self.list_body).hexdigest() + '"'
+        self.requests = 0
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/api/player/list", self.player_list)
+        app.router.add_get("/api/player", self.player)
+        return app
+
+    async def player_list(self, request):
+        self.requests += 1
+        if request.headers.get("If-None-Match") == self.etag:
+            return web.Response(status=304, headers={"ETag": self.etag})
+        headers = {"ETag": self.etag, "Content-Type": "application/json"}
+        if "gzip" in request.headers.get("Accept-Encoding", ""):
+            headers["Content-Encoding"] = "gzip"
+            return web.Response(body=self.list_body_gzip, headers=headers)
+        return web.Response(body=self.list_body, headers=headers)
+
+    async def player(self, request):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * self.random.uniform(1 - self.jitter, 1 + self.jitter))
+        if self.random.random() < self.error_rate:
+            return web.Response(status=500, text="injected error")
+        if "discordId" in request.query:
+            player = self.by_discord_id.get(request.query["discordId"])
+        else:
+            player = self.by_name.get(request.query.get("name", "").casefold())
+        if player is None:
+            return web.Response(status=404, text="Player not found")
+        return web.json_response(player)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a synthetic Lounge API locally.")
+    parser.add_argument("--players", type=int, default=100000)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8181)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per single player lookup")
+    parser.add_argument("--jitter", type=float, default=0.5, help="relative spread of the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of lookups answered with a 500")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    stand_in = LoungeStandIn(generate_players(args.players, args.seed), args.latency,
+                             args.jitter, args.error_rate, args.seed)
+    print(f"Serving {args.players} players on http://{args.host}:{args.port}", flush=True)
+    web.run_app(stand_in.app(), host=args.host, port=args.port, access_log=None, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""Replays a recording against the SquadQueue cog.
+
+Recordings are made by setting "record_path" in config.json, see recorder.py.
+The cog is loaded against the stand-in Discord objects of tools/simulate.py,
+starts from the journal state saved in the recording's header, and runs on a
+clock that starts at the recording's start time and goes --speed times as
+fast as real time.  Mogis therefore open, close and make rooms at the same
+moments as in the recording, and every /c, /d, /sub, /l, vote click and room
+message is fed in at its recorded moment.
+
+The report has the latency per command and Discord calls per route, like
+the simulator's, plus how far the deadlines of the replay drifted from the
+recorded ones.  Run from the repository root:
+
+    python -m tools.replay recording.jsonl.gz --speed 20 --latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import cogs.SquadQueue
+import queues
+from deadlines import DeadlineScheduler
+from journal import Journal, mogi_key
+from mmr import LoungePlayer, lounge_data
+from queues import load_queues
+from recorder import read_recording, describe_key
+from tools.simulate import (FakeDiscord, FakeGuild, FakeChannel, FakeThread, FakeMember, FakeMessage,
+                            FakeBot, FakeInteraction, percentile, _ms)
+
+
+class ReplayClock:
+    """Recorded wall time, running `speed` times as fast as real time from `origin`."""
+
+    def __init__(self, origin, speed):
+        self.origin = origin
+        self.speed = speed
+        self._start = time.monotonic()
+
+    def time(self):
+        return self.origin + (time.monotonic() - self._start) * self.speed
+
+    def elapsed(self):
+        return self.time() - self.origin
+
+    def datetime_class(self):
+        clock = self
+
+        class ReplayDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return datetime.fromtimestamp(clock.time(), tz)
+
+        return ReplayDatetime
+
+    def time_module(self):
+        return SimpleNamespace(time=self.time, monotonic=time.monotonic, perf_counter=time.perf_counter)
+
+
+class ReplayDeadlines(DeadlineScheduler):
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+        self.time_scale = 1 / clock.speed
+
+    def now(self):
+        return datetime.fromtimestamp(self.clock.time(), timezone.utc)
+
+
+class Replay:
+    def __init__(self, args):
+        self.args = args
+        self.header, self.events = read_recording(args.recording)
+        self.fake = FakeDiscord(args.latency, args.jitter, args.rate_limited, args.retry_after, args.seed)
+        self.data_dir = tempfile.mkdtemp(prefix="queuebot-replay-")
+        self.bot = self.make_bot()
+        self.clock = None
+        self.cog = None
+        self.commands = {}
+        self.timings = {}
+        # (seconds since the start, described key) of the deadlines that came up
+        self.ticks = []
+        self.unresolved = 0
+
+    def config(self):
+        config = dict(self.header["config"])
+        config.update({
+            "journal_path": os.path.join(self.data_dir, "journal"),
+            "lounge_snapshot_path": os.path.join(self.data_dir, "lounge_snapshot.pickle"),
+            "url": "http://127.0.0.1:9",
+            "metrics_port": None,
+            "record_path": None,
+        })
+        return config
+
+    def make_bot(self):
+        config = self.config()
+        state = self.header["state"]
+        guilds = {}
+        channels = []
+        for queue in load_queues(config).values():
+            guild = guilds.setdefault(queue.guild_id, FakeGuild(self.fake, queue.guild_id))
+            for channel_id, name in ((queue.join_channel_id, f"{queue.name} join"),
+                                     (queue.sub_channel_id, f"{queue.name} sub"),
+                                     (queue.list_channel_id, f"{queue.name} list"),
+                                     (queue.history_channel_id, f"{queue.name} history")):
+                channels.append(FakeChannel(self.fake, guild, channel_id, name))
+
+        # everyone who shows up in the saved state or the events, with the MMR they had
+        players = {}
+        for saved in state["mogis"].values():
+            for team in saved["teams"]:
+                for member_id, name, mmr, _ in team:
+                    players[member_id] = (name, name, mmr)
+        for event in self.events:
+            if event[1] in ("cmd", "vote", "msg"):
+                user_id, user_name = (event[3], event[4]) if event[1] == "cmd" else (event[2], event[3])
+                name, mmr = user_name, None
+                if event[1] == "cmd" and event[6] is not None:
+                    name, mmr = event[6], event[7]
+                if user_id not in players or mmr is not None:
+                    players[user_id] = (user_name, name, mmr)
+        for guild in guilds.values():
+            for member_id, (user_name, _, _) in players.items():
+                guild.members[member_id] = FakeMember(member_id, user_name, guild)
+        lounge_data.set_players(tuple([LoungePlayer(member_id, name, mmr)
+                                       for member_id, (_, name, mmr) in players.items()]))
+        lounge_data.fetched_at = time.time()
+
+        # room threads of the saved mogis keep their ids, so the cog can fetch them
+        for saved in state["mogis"].values():
+            guild = guilds.get(saved["guild_id"])
+            if guild is None:
+                continue
+            for thread_id in saved["rooms"]:
+                thread = FakeThread(self.fake, guild, int(thread_id), f"room thread {thread_id}")
+                guild.threads[thread.id] = thread
+        return FakeBot(config, list(guilds.values()), channels)
+
+    def write_journal(self):
+        journal = Journal(self.bot.config["journal_path"])
+        journal.state = self.header["state"]
+        journal.snapshot()
+        journal.close()
+
+    def find_channel(self, described):
+        if not isinstance(described, list):
+            return self.bot.get_channel(described)
+        key, room_num = described
+        for mogi, room in self.cog.room_threads.values():
+            if room.room_num == room_num and mogi_key(mogi) == key:
+                return room.thread
+        return None
+
+    async def timed(self, name, coro):
+        start = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            print(f"{name} failed: {e!r}", flush=True)
+        self.timings.setdefault(name, []).append(time.perf_counter() - start)
+
+    async def dispatch(self, event):
+        kind = event[1]
+        if kind == "cmd":
+            _, _, name, user_id, _, described = event[:6]
+        else:
+            _, _, user_id, _, described = event[:5]
+        channel = self.find_channel(described)
+        member = channel.guild.get_member(user_id) if channel is not None else None
+        if member is None:
+            self.unresolved += 1
+            return
+        if kind == "cmd":
+            command = self.commands.get(name)
+            if command is None:
+                self.unresolved += 1
+                return
+            interaction = FakeInteraction(self.fake, member, channel)
+            await self.timed(f"/{name}", command.callback(self.cog, interaction))
+        elif kind == "vote":
+            format_name = event[5]
+            room = self.find_room(channel)
+            if room is None or room.view is None:
+                self.unresolved += 1
+                return
+            button = next(button for button in room.view.children if button.custom_id == format_name)
+            interaction = FakeInteraction(self.fake, member, channel, data={"custom_id": format_name},
+                                          message=room.view.message)
+            await self.timed("vote", button.callback(interaction))
+        elif kind == "msg":
+            message = FakeMessage(self.fake, channel, event[5], member)
+            await self.timed("msg", self.cog.on_message(message))
+
+    def find_room(self, thread):
+        entry = self.cog.room_threads.get(thread.id)
+        return entry[1] if entry is not None else None
+
+    def on_tick(self, key):
+        self.ticks.append((self.clock.elapsed(), describe_key(key)))
+
+    async def run(self):
+        self.write_journal()
+        self.clock = ReplayClock(self.header["started_at"], self.args.speed)
+        patched = [(cogs.SquadQueue, "datetime", self.clock.datetime_class()),
+                   (cogs.SquadQueue, "time", self.clock.time_module()),
+                   (queues, "datetime", self.clock.datetime_class())]
+        originals = [(module, name, getattr(module, name)) for module, name, _ in patched]
+        for module, name, value in patched:
+            setattr(module, name, value)
+        tasks = []
+        started = time.perf_counter()
+        try:
+            self.cog = cogs.SquadQueue.SquadQueue(self.bot)
+            # the leaderboard comes from the recording; never call the real API
+            self.cog.lounge_mmr.cancel()
+            self.cog.deadlines = ReplayDeadlines(self.clock)
+            self.cog.deadlines.on_run = self.on_tick
+            self.commands = {command.name: command for command in self.cog.get_app_commands()}
+            await self.cog.on_ready()
+
+            for event in self.events:
+                if self.args.until is not None and event[0] > self.args.until:
+                    break
+                delay = (event[0] - self.clock.elapsed()) / self.args.speed
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if event[1] != "tick":
+                    tasks.append(asyncio.create_task(self.dispatch(event)))
+            await asyncio.gather(*tasks)
+            # let the deadlines that come up shortly after the last event run too
+            await asyncio.sleep(self.args.tail / self.args.speed)
+            deadline = time.monotonic() + 120
+            while self.cog.outbound.depth() and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+        finally:
+            if self.cog is not None:
+                await self.cog.cog_unload()
+            for module, name, value in originals:
+                setattr(module, name, value)
+            shutil.rmtree(self.data_dir, ignore_errors=True)
+        return self.report(time.perf_counter() - started)
+
+    def report(self, total_time):
+        commands = {}
+        for name, values in sorted(self.timings.items()):
+            commands[name] = {"count": len(values), "p50": percentile(values, 0.5),
+                              "p99": percentile(values, 0.99), "max": max(values)}
+        recorded = {}
+        for event in self.events:
+            if event[1] == "tick":
+                recorded.setdefault(json.dumps(event[2]), []).append(event[0])
+        drifts = []
+        matched = 0
+        for t, key in self.ticks:
+            times = recorded.get(json.dumps(key))
+            if times:
+                drifts.append(abs(t - times.pop(0)))
+                matched += 1
+        return {
+            "events": len(self.events), "speed": self.args.speed, "total_seconds": total_time,
+            "unresolved_events": self.unresolved, "commands": commands,
+            "discord_calls": dict(self.fake.calls.most_common()),
+            "discord_calls_total": sum(self.fake.calls.values()),
+            "rate_limited": sum(self.fake.rate_limits.values()),
+            "ticks_recorded": sum([1 for event in self.events if event[1] == "tick"]),
+            "ticks_replayed": len(self.ticks), "ticks_matched": matched,
+            "tick_drift_p50": percentile(drifts, 0.5), "tick_drift_max": max(drifts) if drifts else None,
+        }
+
+
+def print_report(report):
+    print(f"{report['events']} events replayed at {report['speed']}x in {report['total_seconds']:.1f}s, "
+          f"{report['unresolved_events']} couldn't be matched to a channel, room or member")
+    print(f"\n{'command':>10} {'count':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, stats in report["commands"].items():
+        print(f"{name:>10} {stats['count']:>6} {_ms(stats['p50']):>8} {_ms(stats['p99']):>8} {_ms(stats['max']):>8}")
+    drift = report["tick_drift_max"]
+    print(f"\ndeadlines: {report['ticks_recorded']} recorded, {report['ticks_replayed']} replayed, "
+          f"{report['ticks_matched']} matched, max drift {'-' if drift is None else f'{drift:.2f}'}s of recording time")
+    print(f"\n{report['discord_calls_total']} Discord calls, {report['rate_limited']} rate limited")
+    for route, count in report["discord_calls"].items():
+        print(f"{count:>6}  {route}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recording against the SquadQueue cog offline.")
+    parser.add_argument("recording", help="file written with record_path set")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 replays in real time, 10 ten times as fast")
+    parser.add_argument("--until", type=float, help="stop after this many seconds of the recording")
+    parser.add_argument("--tail", type=float, default=180,
+                        help="seconds of recording time to keep running after the last event")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per Discord call")
+    parser.add_argument("--jitter", type=float, default=0.5, help="relative spread of the latency")
+    parser.add_argument("--rate-limited", type=float, default=0.0, help="share of Discord calls answered with a 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="seconds a 429 waits before the retry")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(Replay(args).run())
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
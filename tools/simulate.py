@@ -0,0 +1,527 @@
+"""Headless load simulator for the SquadQueue cog.
+
+Loads the cog against in-memory stand-ins for discord.py's bot, guild,
+channels, threads and interactions, and plays one hour of the queue:
+
+- a join storm, with some players dropping and joining again
+- the mogi closing and the rooms being made
+- the votes in every room, score messages, /l and /sub
+
+Every stand-in Discord call waits a configurable latency, and a fraction of
+them are rate limited and wait retry_after on top, the way discord.py retries
+a 429.  The report has p50/p99 latency per command, mogi lock contention and
+Discord calls per route.  Run from the repository root:
+
+    python -m tools.simulate --players 200 --latency 0.08 --rate-limited 0.02
+    python -m tools.simulate --players 1200 --json results.json
+
+Nothing talks to Discord or the Lounge API; players' MMR comes from a
+synthetic leaderboard loaded into lounge_data.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timezone, timedelta
+
+import discord
+
+import metrics
+from mmr import LoungePlayer, lounge_data
+from mogi_objects import Mogi
+from cogs.SquadQueue import SquadQueue
+
+GUILD_ID = 1000
+JOIN_CHANNEL_ID = 1001
+SUB_CHANNEL_ID = 1002
+LIST_CHANNEL_ID = 1003
+HISTORY_CHANNEL_ID = 1004
+
+
+def percentile(values, q):
+    """Nearest rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+
+class FakeDiscord:
+    """Shared latency, rate limit and call accounting for every stand-in object."""
+
+    def __init__(self, latency=0.05, jitter=0.5, rate_limited=0.0, retry_after=1.0, seed=None):
+        self.latency = latency
+        # each call takes latency * uniform(1 - jitter, 1 + jitter)
+        self.jitter = jitter
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.rate_limits = Counter()
+        self._ids = itertools.count(10**6)
+
+    def next_id(self):
+        return next(self._ids)
+
+    async def call(self, route):
+        self.calls[route] += 1
+        if self.random.random() < self.rate_limited:
+            self.rate_limits[route] += 1
+            await asyncio.sleep(self.retry_after)
+        await asyncio.sleep(self.latency * self.random.uniform(1 - self.jitter, 1 + self.jitter))
+
+
+class FakeRole:
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+        self.mention = f"<@&{id}>"
+
+
+class FakeMember:
+    def __init__(self, id, name, guild):
+        self.id = id
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{id}>"
+        self.guild = guild
+        self.bot = False
+        self.roles = []
+
+    def get_role(self, role_id):
+        return None
+
+
+class FakeMessage:
+    def __init__(self, fake, channel, content=None, author=None, view=None):
+        self.fake = fake
+        self.id = fake.next_id()
+        self.channel = channel
+        self.content = content
+        self.author = author
+        self.view = view
+        self.jump_url = f"https://discord.com/channels/{channel.guild.id}/{channel.id}/{self.id}"
+
+    async def edit(self, **kwargs):
+        await self.fake.call("PATCH /channels/{channel_id}/messages/{message_id}")
+        self.content = kwargs.get("content", self.content)
+        return self
+
+    async def delete(self, delay=None):
+        if delay:
+            asyncio.get_running_loop().call_later(
+                delay, lambda: asyncio.ensure_future(self.delete()))
+            return
+        await self.fake.call("DELETE /channels/{channel_id}/messages/{message_id}")
+
+
+class FakeChannel:
+    def __init__(self, fake, guild, id, name):
+        self.fake = fake
+        self.guild = guild
+        self.id = id
+        self.name = name
+        self.mention = f"<#{id}>"
+        self.jump_url = f"https://discord.com/channels/{guild.id}/{id}"
+        self.overwrites = {}
+        # sent messages, newest last
+        self.messages = []
+
+    def __str__(self):
+        return self.name
+
+    async def send(self, content=None, view=None, delete_after=None, **kwargs):
+        await self.fake.call("POST /channels/{channel_id}/messages")
+        message = FakeMessage(self.fake, self, content, view=view)
+        self.messages.append(message)
+        if delete_after:
+            await message.delete(delay=delete_after)
+        return message
+
+    async def delete_messages(self, messages):
+        await self.fake.call("POST /channels/{channel_id}/messages/bulk-delete")
+
+    async def purge(self, **kwargs):
+        await self.fake.call("GET /channels/{channel_id}/messages")
+        return []
+
+    def get_partial_message(self, message_id):
+        message = FakeMessage(self.fake, self)
+        message.id = message_id
+        return message
+
+    def overwrites_for(self, target):
+        return self.overwrites.get(target.id, discord.PermissionOverwrite())
+
+    async def set_permissions(self, target, overwrite=None, **kwargs):
+        await self.fake.call("PUT /channels/{channel_id}/permissions/{overwrite_id}")
+        self.overwrites[target.id] = overwrite
+
+    async def create_thread(self, name, **kwargs):
+        await self.fake.call("POST /channels/{channel_id}/threads")
+        thread = FakeThread(self.fake, self.guild, self.fake.next_id(), name)
+        self.guild.threads[thread.id] = thread
+        return thread
+
+
+class FakeThread(FakeChannel):
+    async def delete(self):
+        await self.fake.call("DELETE /channels/{channel_id}")
+        self.guild.threads.pop(self.id, None)
+
+
+class FakeGuild:
+    def __init__(self, fake, id):
+        self.fake = fake
+        self.id = id
+        self.default_role = FakeRole(id, "@everyone")
+        self.members = {}
+        self.threads = {}
+
+    def __str__(self):
+        return "simulated guild"
+
+    def get_member(self, member_id):
+        return self.members.get(member_id)
+
+    async def fetch_member(self, member_id):
+        await self.fake.call("GET /guilds/{guild_id}/members/{user_id}")
+        return self.members[member_id]
+
+    def get_thread(self, thread_id):
+        return self.threads.get(thread_id)
+
+    async def fetch_channel(self, channel_id):
+        await self.fake.call("GET /channels/{channel_id}")
+        return self.threads[channel_id]
+
+    def get_role(self, role_id):
+        return FakeRole(role_id, str(role_id))
+
+
+class FakeBot:
+    def __init__(self, config, guilds, channels):
+        self.config = config
+        self.guilds = {guild.id: guild for guild in guilds}
+        self.channels = {channel.id: channel for channel in channels}
+        self.http = None
+
+    def get_guild(self, guild_id):
+        return self.guilds.get(guild_id)
+
+    def get_channel(self, channel_id):
+        channel = self.channels.get(channel_id)
+        if channel is not None:
+            return channel
+        for guild in self.guilds.values():
+            if channel_id in guild.threads:
+                return guild.threads[channel_id]
+        return None
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def defer(self, **kwargs):
+        self._done = True
+        await self.interaction.fake.call("POST /interactions/{interaction_id}/{interaction_token}/callback")
+
+    async def send_message(self, content=None, **kwargs):
+        self._done = True
+        await self.interaction.fake.call("POST /interactions/{interaction_id}/{interaction_token}/callback")
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        await self.interaction.fake.call("POST /webhooks/{application_id}/{interaction_token}")
+
+    async def edit_message(self, message_id, **kwargs):
+        await self.interaction.fake.call(
+            "PATCH /webhooks/{application_id}/{interaction_token}/messages/{message_id}")
+
+
+class FakeInteraction:
+    def __init__(self, fake, user, channel, data=None, message=None):
+        self.fake = fake
+        self.id = fake.next_id()
+        self.user = user
+        self.channel = channel
+        self.channel_id = channel.id
+        self.guild = channel.guild
+        self.data = data or {}
+        self.message = message
+        self.extras = {}
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+
+
+class Simulation:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.fake = FakeDiscord(args.latency, args.jitter, args.rate_limited, args.retry_after, args.seed)
+        self.guild = FakeGuild(self.fake, GUILD_ID)
+        channels = [FakeChannel(self.fake, self.guild, channel_id, name) for channel_id, name in (
+            (JOIN_CHANNEL_ID, "join"), (SUB_CHANNEL_ID, "sub"),
+            (LIST_CHANNEL_ID, "list"), (HISTORY_CHANNEL_ID, "history"))]
+        self.join_channel = channels[0]
+        self.data_dir = tempfile.mkdtemp(prefix="queuebot-sim-")
+        self.bot = FakeBot(self.config(), [self.guild], channels)
+        self.players = []
+        # command -> handling times in seconds
+        self.timings = {}
+        self.peak_outbound = 0
+        self.cog = None
+
+    def config(self):
+        args = self.args
+        return {
+            "guild_id": GUILD_ID,
+            "admin_roles": {}, "staff_roles": {}, "members_for_channels": {},
+            "queue_join_channel": JOIN_CHANNEL_ID, "queue_sub_channel": SUB_CHANNEL_ID,
+            "queue_list_channel": LIST_CHANNEL_ID, "queue_history_channel": HISTORY_CHANNEL_ID,
+            "queue_messages": True, "sec_between_queue_msgs": 2,
+            "url": "http://127.0.0.1:9", "username": None, "password": None,
+            "lounge_snapshot_path": f"{self.data_dir}/lounge_snapshot.pickle",
+            "journal_path": f"{self.data_dir}/journal",
+            "QUEUE_OPEN_TIME": 60, "JOINING_TIME": 55,
+            # the extension is in minutes, the simulator's knob is in seconds
+            "EXTENSION_TIME": args.extension / 60,
+            "MOGI_LIFETIME": 180, "SUB_MESSAGE_LIFETIME_SECONDS": 1200,
+            "SIX_VS_SIX_THRESHOLD": 10000, "ROOM_FANOUT": args.room_fanout,
+            "LIST_UPDATE_INTERVAL": args.list_interval,
+            "MATCHMAKING_STRATEGY": args.strategy, "TEAM_SPLIT_BUDGET_MS": 3,
+        }
+
+    def make_players(self):
+        records = []
+        for i in range(self.args.players):
+            member = FakeMember(self.fake.next_id(), f"Player{i + 1}", self.guild)
+            self.guild.members[member.id] = member
+            self.players.append(member)
+            records.append(LoungePlayer(member.id, member.name,
+                                        max(0, int(self.rng.gauss(6000, 2500)))))
+        lounge_data.set_players(tuple(records))
+        lounge_data.fetched_at = time.time()
+
+    async def timed(self, name, coro):
+        start = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            print(f"{name} failed: {e!r}", flush=True)
+        self.timings.setdefault(name, []).append(time.perf_counter() - start)
+
+    async def command(self, name, user, channel):
+        command = getattr(self.cog, name)
+        interaction = FakeInteraction(self.fake, user, channel)
+        await self.timed(f"/{command.name}", command.callback(self.cog, interaction))
+
+    async def watch_outbound(self):
+        while True:
+            self.peak_outbound = max(self.peak_outbound, self.cog.outbound.depth())
+            await asyncio.sleep(0.05)
+
+    async def start(self):
+        self.make_players()
+        self.cog = SquadQueue(self.bot)
+        # the simulated leaderboard is already loaded; never call the real API
+        self.cog.lounge_mmr.cancel()
+        queue = next(iter(self.cog.queues.values()))
+        # keep the hourly scheduler from adding mogis of its own
+        queue.QUEUE_TIME_BLOCKER = datetime.now(timezone.utc) + timedelta(weeks=52)
+        await self.cog.on_ready()
+        return queue
+
+    async def open_mogi(self, queue):
+        """Opens a mogi whose joining time ends when the join storm does."""
+        joining_end = datetime.now(timezone.utc) + timedelta(seconds=self.args.storm)
+        mogi = Mogi(1, 1, queue.MOGI_CHANNEL, is_automated=True,
+                    start_time=joining_end - queue.JOINING_TIME + queue.QUEUE_OPEN_TIME,
+                    matchmaking_strategy=queue.MATCHMAKING_STRATEGY)
+        queue.scheduled.append(mogi)
+        self.cog.journal.mogi(mogi, "scheduled")
+        await self.cog.scheduler_mogi_start(queue)
+        return mogi
+
+    async def join_storm(self):
+        args = self.args
+
+        async def player(member):
+            await asyncio.sleep(self.rng.uniform(0, args.storm * 0.8))
+            await self.command("can", member, self.join_channel)
+            if self.rng.random() < args.drop_rate:
+                await asyncio.sleep(self.rng.uniform(0, args.storm * 0.1))
+                await self.command("drop", member, self.join_channel)
+                if self.rng.random() < 0.5:
+                    await self.command("can", member, self.join_channel)
+            if self.rng.random() < args.list_rate:
+                await self.command("list", member, self.join_channel)
+
+        await asyncio.gather(*[player(member) for member in self.players])
+
+    async def wait_for(self, condition, timeout):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    async def play_rooms(self, mogi):
+        args = self.args
+        formats = list(mogi.rooms[0].view.FORMATS) if mogi.rooms and mogi.rooms[0].view else []
+        votes_end_at = time.time() + args.vote_seconds
+        for room in mogi.rooms:
+            # the vote window in the cog is two minutes; the simulator shortens it
+            self.cog.schedule_room_vote_end(mogi, room, votes_end_at)
+
+        async def vote(room, member):
+            await asyncio.sleep(self.rng.uniform(0, args.vote_seconds * 0.8))
+            view = room.view
+            if view is None or view.found_winner:
+                return
+            choice = "FFA" if self.rng.random() < args.ffa_share else self.rng.choice(formats[1:4])
+            button = next(button for button in view.children if button.custom_id == choice)
+            interaction = FakeInteraction(self.fake, member, room.thread,
+                                          data={"custom_id": choice}, message=view.message)
+            await self.timed("vote", button.callback(interaction))
+
+        async def score(room, member):
+            await asyncio.sleep(self.rng.uniform(0, args.vote_seconds))
+            message = FakeMessage(self.fake, room.thread, str(self.rng.randint(12, 180)), member)
+            await self.timed("score", self.cog.on_message(message))
+
+        tasks = []
+        for room in mogi.rooms:
+            if room.teams is None:
+                continue
+            members = [player.member for team in room.teams for player in team.players]
+            tasks += [vote(room, member) for member in members]
+        await asyncio.gather(*tasks)
+        await self.wait_for(lambda: all([room.finished for room in mogi.rooms if room.view]),
+                            args.vote_seconds + 10)
+        tasks = []
+        for room in mogi.rooms:
+            if room.teams is None:
+                continue
+            tasks += [score(room, player.member) for player in room.players.values()]
+            if self.rng.random() < args.sub_rate:
+                tasks.append(self.command("sub", next(iter(room.players.values())).member, room.thread))
+        await asyncio.gather(*tasks)
+
+    async def run(self):
+        started = time.perf_counter()
+        queue = await self.start()
+        watcher = asyncio.create_task(self.watch_outbound())
+        try:
+            mogi = await self.open_mogi(queue)
+            storm_start = time.perf_counter()
+            await self.join_storm()
+            storm_time = time.perf_counter() - storm_start
+            ready = await self.wait_for(
+                lambda: mogi.making_rooms_run and all([room.view is not None and room.view.message is not None
+                                                       for room in mogi.rooms]),
+                self.args.storm + self.args.extension + 60)
+            rooms_time = time.perf_counter() - storm_start
+            if ready:
+                await self.play_rooms(mogi)
+            await self.wait_for(lambda: self.cog.outbound.depth() == 0, 120)
+        finally:
+            watcher.cancel()
+            await self.cog.cog_unload()
+            shutil.rmtree(self.data_dir, ignore_errors=True)
+        return self.report(mogi, storm_time, rooms_time if ready else None,
+                           time.perf_counter() - started)
+
+    def report(self, mogi, storm_time, rooms_time, total_time):
+        commands = {}
+        for name, values in sorted(self.timings.items()):
+            commands[name] = {"count": len(values), "p50": percentile(values, 0.5),
+                              "p99": percentile(values, 0.99), "max": max(values)}
+        locks = {}
+        for labels in metrics.LOCK_WAIT.series():
+            count, total = metrics.LOCK_WAIT.totals(**labels)
+            hold_count, hold_total = metrics.LOCK_HOLD.totals(**labels)
+            locks[labels["caller"]] = {
+                "count": count, "wait_mean": total / count,
+                "wait_p99_bucket": metrics.LOCK_WAIT.quantile(0.99, **labels),
+                "hold_mean": hold_total / hold_count if hold_count else None}
+        return {
+            "players": self.args.players, "registered": mogi.count_registered(),
+            "rooms": len([room for room in mogi.rooms if room.teams is not None]),
+            "storm_seconds": storm_time, "rooms_ready_seconds": rooms_time, "total_seconds": total_time,
+            "commands": commands, "locks": locks,
+            "discord_calls": dict(self.fake.calls.most_common()),
+            "discord_calls_total": sum(self.fake.calls.values()),
+            "rate_limited": sum(self.fake.rate_limits.values()),
+            "peak_outbound_depth": self.peak_outbound,
+        }
+
+
+def _ms(value):
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+
+def print_report(report):
+    print(f"{report['players']} players, {report['registered']} registered, {report['rooms']} rooms")
+    rooms_ready = report["rooms_ready_seconds"]
+    print(f"join storm {report['storm_seconds']:.1f}s, rooms ready after "
+          f"{'-' if rooms_ready is None else f'{rooms_ready:.1f}'}s, total {report['total_seconds']:.1f}s")
+    print(f"\n{'command':>10} {'count':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, stats in report["commands"].items():
+        print(f"{name:>10} {stats['count']:>6} {_ms(stats['p50']):>8} {_ms(stats['p99']):>8} {_ms(stats['max']):>8}")
+    print(f"\n{'lock':>14} {'count':>6} {'wait ms':>8} {'p99 <= ms':>10} {'hold ms':>8}")
+    for caller, stats in report["locks"].items():
+        print(f"{caller:>14} {stats['count']:>6} {_ms(stats['wait_mean']):>8} "
+              f"{_ms(stats['wait_p99_bucket']):>10} {_ms(stats['hold_mean']):>8}")
+    print(f"\n{report['discord_calls_total']} Discord calls, {report['rate_limited']} rate limited, "
+          f"peak outbound queue {report['peak_outbound_depth']}")
+    for route, count in report["discord_calls"].items():
+        print(f"{count:>6}  {route}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate a peak hour against the SquadQueue cog offline.")
+    parser.add_argument("--players", type=int, default=200)
+    parser.add_argument("--storm", type=float, default=10, help="seconds of joining before the queue closes")
+    parser.add_argument("--extension", type=float, default=3, help="seconds of extension for late teams")
+    parser.add_argument("--drop-rate", type=float, default=0.1, help="share of players who /d after joining")
+    parser.add_argument("--list-rate", type=float, default=0.05, help="share of players who use /l")
+    parser.add_argument("--sub-rate", type=float, default=0.2, help="share of rooms that ask for a sub")
+    parser.add_argument("--vote-seconds", type=float, default=5, help="vote window in every room")
+    parser.add_argument("--ffa-share", type=float, default=0.6, help="share of votes for FFA")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per Discord call")
+    parser.add_argument("--jitter", type=float, default=0.5, help="relative spread of the latency")
+    parser.add_argument("--rate-limited", type=float, default=0.0, help="share of Discord calls answered with a 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="seconds a 429 waits before the retry")
+    parser.add_argument("--room-fanout", type=int, default=10)
+    parser.add_argument("--list-interval", type=float, default=10)
+    parser.add_argument("--strategy", default="sorted")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(Simulation(args).run())
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())